@@ -1,12 +1,16 @@
-import xml.etree.cElementTree as ET
 from collections import defaultdict
 import regex as re
 import pprint
 
+from osm_reader import get_element
 from auditing_street_names import VANCOUVER_CITY_SAMPLE, VANCOUVER_CITY_OSM
 # imports my OSM files
 
-postal_code_re = re.compile(r'[A-Z^DFIOQUWZ]\d[A-Z^DFIOQU]\s\d[A-Z^DFIOQU]\d$')
+POSTAL_CODE_PATTERN = r'[A-Z^DFIOQUWZ]\d[A-Z^DFIOQU]%s\d[A-Z^DFIOQU]\d$'
+""" Canadian postal code pattern, with %s where the separator between the two
+    groups of three goes (shared with updating_postal_codes.py)
+"""
+postal_code_re = re.compile(POSTAL_CODE_PATTERN % r'\s')
 """ Regex that makes sure that postal codes are in the Canadian format. That is,
     alternating uppercase letters and numbers, grouped by 3s, with a space
     after the first group (for example, V6T 1Z4).
@@ -52,11 +56,10 @@ def audit(osmfile):
     """
     correct_PCs = []
     incorrect_PCs = []
-    for event, element in ET.iterparse(osmfile, events=("start", )):
-        if element.tag == 'node' or element.tag == 'way':
-            for tag in element.iter('tag'):
-                if is_postal_code(tag):
-                    audit_postal_code(correct_PCs, incorrect_PCs, tag.attrib['v'])
+    for element in get_element(osmfile, tags=('node', 'way')):
+        for tag in element.iter('tag'):
+            if is_postal_code(tag):
+                audit_postal_code(correct_PCs, incorrect_PCs, tag.attrib['v'])
 
     return incorrect_PCs
 
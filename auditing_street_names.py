@@ -1,8 +1,9 @@
-import xml.etree.cElementTree as ET
 from collections import defaultdict
 import regex as re
 import pprint
 
+from osm_reader import get_element
+
 VANCOUVER_CITY_OSM = "/Users/nehaludyavar/Downloads/Vancouver_City_v2.osm"
 VANCOUVER_CITY_SAMPLE = "/Users/nehaludyavar/Downloads/Vancouver_City_Sample.osm"
 """ The Vancouver OSM file and a created sample """
@@ -50,16 +51,16 @@ def audit(osmfile):
             dictionary: street type:street name value pairs.
     """
     street_types = defaultdict(set)
-    for event, element in ET.iterparse(osmfile, events=("start", )):
-        if element.tag == "way" or element.tag == "node":
-            for tag in element.iter("tag"):
-                if is_street_name(tag):
-                    audit_street_type(street_types, tag.attrib['v'])
+    for element in get_element(osmfile, tags=("node", "way")):
+        for tag in element.iter("tag"):
+            if is_street_name(tag):
+                audit_street_type(street_types, tag.attrib['v'])
     return street_types
 
 def print_audit(osmfile):
     """ Prints the result of the 'audit' function, and the length of the
     returned dictionary.
     """
-    pprint.pprint(dict(audit(osmfile)))
-    print len(audit(osmfile))
+    street_types = audit(osmfile)
+    pprint.pprint(dict(street_types))
+    print len(street_types)
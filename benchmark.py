@@ -0,0 +1,193 @@
+import json
+import multiprocessing
+import os
+import pprint
+import re
+import resource
+import shutil
+import tempfile
+import time
+
+SAMPLE_OSM = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "OSM Sample", "Vancouver_City_Sample.osm")
+""" The sample of the Vancouver OSM file that ships with the repo """
+
+BASELINE_PATH = "benchmark_baseline.json"
+
+SCALES = (1, 10, 100)
+""" Sizes of the benchmarked files, as multiples of the sample """
+
+STAGES = ['parse', 'shape', 'validate', 'csv_write']
+""" Pipeline stages, in order. Each stage is timed by running the pipeline up
+    to and including it, and subtracting the time of the previous stage.
+"""
+
+REGRESSION_TOLERANCE = 0.2
+""" A stage is a regression if its throughput drops by more than this """
+
+ID_ATTRIBUTE = re.compile(r'( id| ref)="(-?\d+)"')
+
+
+def best_time(function, repeat=3):
+    """ Calls 'function' 'repeat' times, and returns the shortest time it
+        took, in seconds, with the result of the last call
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        result = function()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def scale_osm(osm_file, out_file, factor):
+    """ Writes a synthetic OSM file 'factor' times bigger than 'osm_file', by
+        repeating its elements with ids (and node/member references) shifted
+        for each copy, so that every id stays unique.
+    """
+    with open(osm_file, 'rb') as f:
+        data = f.read()
+    start = data.index('<node')
+    end = data.rindex('</')
+    body = data[start:end]
+    with open(out_file, 'wb') as f:
+        f.write(data[:start])
+        for copy in range(factor):
+            offset = copy * 10 ** 11
+            f.write(ID_ATTRIBUTE.sub(
+                lambda m: '%s="%d"' % (m.group(1), int(m.group(2)) + offset), body))
+        f.write(data[end:])
+
+
+def run_stage(osm_file, stage, work_dir):
+    """ Runs the pipeline up to 'stage' on the file, and returns the number
+        of elements and the seconds it took.
+    """
+    from osm_reader import get_element
+    from preparing_for_database import shape_element, validate_element, \
+        process_map
+    from schema_compiler import FastValidator
+
+    count = 0
+    start = time.time()
+    if stage == 'parse':
+        for element in get_element(osm_file, tags=('node', 'way')):
+            count += 1
+    elif stage in ('shape', 'validate'):
+        validator = FastValidator()
+        for element in get_element(osm_file, tags=('node', 'way')):
+            el = shape_element(element, compact_way_nodes=True)
+            if stage == 'validate':
+                validate_element(el, validator)
+            count += 1
+    elif stage == 'csv_write':
+        os.chdir(work_dir)
+        process_map(osm_file, True)
+    elif stage == 'sql_import':
+        from sql_importer import import_csvs
+        os.chdir(work_dir)
+        import_csvs('benchmark.db')
+    return count, time.time() - start
+
+
+def _run_stage(osm_file, stage, work_dir, queue):
+    try:
+        count, seconds = run_stage(osm_file, stage, work_dir)
+    except Exception as e:
+        queue.put(e)
+        raise
+    queue.put((count, seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def measure_stage(osm_file, stage, work_dir):
+    """ Runs one stage in a fresh process, so that its peak memory is measured
+        on its own. Returns (elements, seconds, peak RSS).
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_stage,
+                                      args=(osm_file, stage, work_dir, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def benchmark_file(osm_file, work_dir):
+    """ Benchmarks every stage on one file.
+
+        Returns:
+            dictionary: stage:{seconds, elements_per_second, peak_rss} pairs,
+            plus the file size in MB.
+    """
+    results = {'megabytes': os.path.getsize(osm_file) / 1e6}
+    elements = None
+    previous = 0.0
+    for stage in STAGES + ['sql_import']:
+        count, total, peak = measure_stage(osm_file, stage, work_dir)
+        if stage == 'parse':
+            elements = count
+        if stage == 'sql_import':
+            seconds = total
+        else:
+            seconds = max(total - previous, 1e-9)
+            previous = total
+        results[stage] = {
+            'seconds': seconds,
+            'elements_per_second': elements / seconds,
+            'peak_rss': peak
+        }
+    results['elements'] = elements
+    return results
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """ Returns a list of (scale, stage, baseline throughput, throughput) for
+        every stage whose throughput dropped by more than 'tolerance'.
+    """
+    regressions = []
+    for scale, stages in sorted(results.items()):
+        for stage in STAGES + ['sql_import']:
+            try:
+                before = baseline[scale][stage]['elements_per_second']
+            except KeyError:
+                continue
+            after = stages[stage]['elements_per_second']
+            if after < before * (1 - tolerance):
+                regressions.append((scale, stage, before, after))
+    return regressions
+
+
+def run(osm_file=SAMPLE_OSM, scales=SCALES, baseline_path=BASELINE_PATH,
+        save_baseline=False):
+    """ Benchmarks the pipeline on the sample and on synthetic files scaled up
+        from it, prints the results and any regressions against the stored
+        baseline, and optionally stores the results as the new baseline.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    results = {}
+    try:
+        for scale in scales:
+            if scale == 1:
+                scaled_file = osm_file
+            else:
+                scaled_file = os.path.join(tmp_dir, 'scaled_%dx.osm' % scale)
+                scale_osm(osm_file, scaled_file, scale)
+            results['%dx' % scale] = benchmark_file(scaled_file, tmp_dir)
+            if scaled_file != osm_file:
+                os.remove(scaled_file)
+    finally:
+        shutil.rmtree(tmp_dir)
+    pprint.pprint(results)
+
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            regressions = compare(results, json.load(f))
+        pprint.pprint({'regressions': regressions})
+
+    if save_baseline:
+        with open(baseline_path, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return results
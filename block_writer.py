@@ -0,0 +1,247 @@
+from operator import itemgetter
+import codecs
+import os
+import pprint
+import re
+import shutil
+import tempfile
+import time
+
+BLOCK_SIZE = 10000
+""" Number of rows buffered before they are encoded and written """
+
+NEEDS_QUOTING = re.compile(u'[,"\r\n]')
+""" Characters that make the csv module (excel dialect, QUOTE_MINIMAL) quote
+    a field
+"""
+LINE_NEEDS_QUOTING = re.compile(u'["\r\n]')
+""" The same, for a joined line, whose commas are checked by counting them """
+
+PLAIN_TYPES = frozenset([unicode, str, int, long, bool])
+""" Types that the csv module writes as unicode() would """
+
+
+def field_text(value):
+    """ Returns the text the csv module writes for a value """
+    if isinstance(value, unicode):
+        return value
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    if value is None:
+        return u''
+    if isinstance(value, float):
+        return repr(value).decode('ascii')
+    return unicode(value)
+
+
+def csv_line(values):
+    """ Returns one row as the csv module writes it (excel dialect,
+        QUOTE_MINIMAL), without the line terminator.
+    """
+    fields = [field_text(value) for value in values]
+    line = u','.join(fields)
+    if line.count(u',') != len(fields) - 1 or LINE_NEEDS_QUOTING.search(line):
+        line = u','.join([u'"' + field.replace(u'"', u'""') + u'"'
+                          if NEEDS_QUOTING.search(field) else field
+                          for field in fields])
+    elif len(fields) == 1 and not line:
+        line = u'""'        # The csv module quotes a lone empty field
+    return line
+
+
+class BlockWriter(object):
+    """ Replacement for UnicodeDictWriter that writes the same bytes. Rows are
+        kept as tuples in the field order and buffered; every 'block_size'
+        rows they are joined into one unicode string, which is UTF-8 encoded
+        and written in a single call.
+
+        A block of rows whose fields are all text is joined without looking at
+        the fields one by one, and is only checked as a whole for characters
+        that need quoting. Otherwise only the rows with other fields, or with
+        characters that need quoting, are written field by field.
+        Fields missing from a dictionary row are written as '', like
+        csv.DictWriter; unlike it, extra keys are ignored rather than raising
+        ValueError.
+
+        Rows of integers, such as compact way nodes, can be written with
+        writeints(), which formats them without any of those checks.
+
+        Call flush() before closing the file.
+    """
+
+    def __init__(self, f, fieldnames, block_size=BLOCK_SIZE):
+        self.f = f
+        self.fieldnames = list(fieldnames)
+        self.block_size = block_size
+        self.rows = []
+        self.chunks = []
+        self.int_rows = 0
+        self.int_line = ','.join(['%d'] * len(self.fieldnames)) + '\r\n'
+        self.commas = len(self.fieldnames) - 1
+        if len(self.fieldnames) == 1:
+            getter = itemgetter(*self.fieldnames)
+            self.getter = lambda row: (getter(row),)
+        else:
+            self.getter = itemgetter(*self.fieldnames)
+
+    def writeheader(self):
+        self.writevalues(self.fieldnames)
+
+    def writerow(self, row):
+        try:
+            values = self.getter(row)
+        except KeyError:
+            values = tuple(row.get(field, u'') for field in self.fieldnames)
+        self.rows.append(values)
+        if len(self.rows) >= self.block_size:
+            self.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def writevalues(self, values):
+        """ Writes one row given as a sequence of values in field order """
+        self.rows.append(values)
+        if len(self.rows) >= self.block_size:
+            self.flush()
+
+    def writetuples(self, rows):
+        """ Writes rows given as sequences of values in field order """
+        self.rows.extend(rows)
+        if len(self.rows) >= self.block_size:
+            self.flush()
+
+    def writeints(self, rows):
+        """ Writes rows whose values are all integers, which never need quoting """
+        if self.rows:
+            self.chunks.append(self.encode_rows())
+        int_line = self.int_line
+        self.chunks.append(''.join([int_line % row for row in rows]))
+        self.int_rows += len(rows)
+        if self.int_rows >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        """ Encodes and writes the buffered rows """
+        if self.rows:
+            self.chunks.append(self.encode_rows())
+        if self.chunks:
+            self.f.write(''.join(self.chunks))
+            self.chunks = []
+            self.int_rows = 0
+
+    def encode_rows(self):
+        """ Returns the buffered rows as UTF-8 CSV lines, and empties the buffer """
+        rows = self.rows
+        join = u','.join
+        commas = self.commas
+        block = None
+        if commas:
+            try:
+                block = u'\n'.join([join(values) for values in rows])
+            except (TypeError, UnicodeDecodeError):
+                pass
+            else:
+                if (block.count(u',') != commas * len(rows) or
+                        block.count(u'\n') != len(rows) - 1 or
+                        u'"' in block or u'\r' in block):
+                    block = None
+                else:
+                    block = block.replace(u'\n', u'\r\n')
+        if block is None:
+            # Some row has a field that isn't text or needs quoting
+            needs_quoting = LINE_NEEDS_QUOTING.search
+            lines = []
+            for values in rows:
+                try:
+                    line = join(values)
+                except (TypeError, UnicodeDecodeError):
+                    if PLAIN_TYPES.issuperset(map(type, values)):
+                        try:
+                            line = join(map(unicode, values))
+                        except UnicodeDecodeError:
+                            line = None
+                    else:
+                        line = None
+                if line is None or line.count(u',') != commas or \
+                        needs_quoting(line) or not (line or commas):
+                    line = csv_line(values)
+                lines.append(line)
+            block = u'\r\n'.join(lines)
+        self.rows = []
+        return (block + u'\r\n').encode('utf-8')
+
+
+# ================================ #
+#           Benchmark              #
+# ================================ #
+
+def benchmark(osm_file, repeat=3):
+    """ Shapes every node, way and relation in the file, then times writing
+        the CSV files with UnicodeDictWriter and with BlockWriter, and checks
+        that both write the same bytes.
+    """
+    from osm_reader import get_element
+    from parallel_processing import OUTPUTS
+    from preparing_for_database import shape_element, UnicodeDictWriter
+
+    shaped = [(element.tag, shape_element(element))
+              for element in get_element(osm_file, tags=('node', 'way', 'relation'))]
+    tmp_dir = tempfile.mkdtemp()
+
+    def write(writer_class, out_dir):
+        files = [codecs.open(os.path.join(out_dir, path), 'w')
+                 for path, _ in OUTPUTS]
+        writers = [writer_class(f, fields)
+                   for f, (_, fields) in zip(files, OUTPUTS)]
+        (nodes, nodes_tags, ways, way_nodes, way_tags,
+         relations, relation_members, relation_tags) = writers
+        start = time.time()
+        for writer in writers:
+            writer.writeheader()
+        for tag, el in shaped:
+            if tag == 'node':
+                nodes.writerow(el['node'])
+                nodes_tags.writerows(el['node_tags'])
+            elif tag == 'way':
+                ways.writerow(el['way'])
+                way_nodes.writerows(el['way_nodes'])
+                way_tags.writerows(el['way_tags'])
+            else:
+                relations.writerow(el['relation'])
+                relation_members.writerows(el['relation_members'])
+                relation_tags.writerows(el['relation_tags'])
+        for writer in writers:
+            if hasattr(writer, 'flush'):
+                writer.flush()
+        for f in files:
+            f.close()
+        return time.time() - start
+
+    try:
+        times = {}
+        for name, writer_class in (('dict_writer', UnicodeDictWriter),
+                                   ('block_writer', BlockWriter)):
+            out_dir = os.path.join(tmp_dir, name)
+            os.mkdir(out_dir)
+            times[name] = min(write(writer_class, out_dir) for _ in range(repeat))
+
+        identical = True
+        for path, _ in OUTPUTS:
+            with open(os.path.join(tmp_dir, 'dict_writer', path), 'rb') as f:
+                expected = f.read()
+            with open(os.path.join(tmp_dir, 'block_writer', path), 'rb') as f:
+                identical = identical and f.read() == expected
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    results = {
+        'elements': len(shaped),
+        'identical': identical,
+        'dict_writer_seconds': times['dict_writer'],
+        'block_writer_seconds': times['block_writer'],
+        'speedup': times['dict_writer'] / times['block_writer']
+    }
+    pprint.pprint(results)
+    return results
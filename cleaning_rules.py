@@ -0,0 +1,185 @@
+from collections import OrderedDict
+import json
+import os
+import pprint
+import time
+
+from normalization_cache import CACHE_SIZE, NormalizationCache
+from street_rewriter import street_rewriter
+from updating_postal_codes import shape_update_postal_code, \
+    postal_code_re_alt, postal_code_number_re
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "cleaning_rules.json")
+""" The default rules: which cleaner runs on which tag key, for which
+    element types, and with which options
+"""
+
+ELEMENT_TYPES = ('node', 'way', 'relation')
+
+MAX_EXAMPLES = 20
+""" Number of changed values each rule keeps as examples for its report """
+
+CLEANERS = {}
+""" Cleaner factories by name. A factory takes the rule's options and returns
+    the cleaning function (one string value in, the cleaned value out) and a
+    fingerprint of everything its results depend on, for the rule's cache.
+"""
+
+
+def cleaner(name):
+    """ Decorator that registers a cleaner factory under 'name', so that rules
+        in the config file can use it
+    """
+    def register(factory):
+        CLEANERS[name] = factory
+        return factory
+    return register
+
+
+@cleaner('street_type')
+def street_type_cleaner(mapping):
+    """ Rewrites an incorrect street type at the end of a street name, see
+        street_rewriter.py
+    """
+    return street_rewriter(mapping).rewrite, sorted(mapping.items())
+
+
+POSTAL_CODE_CLEANER_VERSION = 2
+""" Part of the postcode cleaner's fingerprint. Version 1 dropped the last
+    character of postcodes that already had a space ('V5V 3R8' became
+    'V5V  3R'), so its saved caches are ignored.
+"""
+
+
+@cleaner('canadian_postal_code')
+def canadian_postal_code_cleaner():
+    """ Puts Canadian postcodes in the 'V6T 1Z4' form, see
+        updating_postal_codes.py
+    """
+    return (shape_update_postal_code,
+            (POSTAL_CODE_CLEANER_VERSION, postal_code_re_alt.pattern,
+             postal_code_number_re.pattern))
+
+
+class CleaningRule(object):
+    """ One cleaner applied to the values of one tag key. Values go through a
+        NormalizationCache, so each distinct value is only cleaned once. The
+        rule counts the values it sees and changes, the time spent on them,
+        and keeps a few examples of the dirty values it changed.
+    """
+
+    def __init__(self, name, key, elements, function, fingerprint=None,
+                 options=None, cleaner=None, cache_size=CACHE_SIZE):
+        self.name = name
+        self.key = key
+        self.cleaner = cleaner
+        self.elements = tuple(elements)
+        self.options = options or {}
+        self.cache = NormalizationCache(function, max_size=cache_size,
+                                        fingerprint=fingerprint)
+        self.values = 0
+        self.changed = 0
+        self.seconds = 0.0
+        self.examples = {}
+
+    def __call__(self, value):
+        start = time.time()
+        result = self.cache(value)
+        self.seconds += time.time() - start
+        self.values += 1
+        if result != value:
+            self.changed += 1
+            if len(self.examples) < MAX_EXAMPLES:
+                self.examples.setdefault(value, result)
+        return result
+
+    def stats(self):
+        return {
+            'key': self.key,
+            'values': self.values,
+            'changed': self.changed,
+            'seconds': self.seconds,
+            'examples': dict(self.examples),
+            'cache': self.cache.stats()
+        }
+
+
+class RuleSet(object):
+    """ The cleaning rules, compiled into a dispatch table per element type
+        that maps each tag key to its rule. shape_element looks up every tag
+        key in it, so adding a rule doesn't add a branch.
+    """
+
+    def __init__(self, rules):
+        self.rules = OrderedDict()
+        self.dispatch = dict((element, {}) for element in ELEMENT_TYPES)
+        for rule in rules:
+            if rule.name in self.rules:
+                raise ValueError("Duplicate cleaning rule %r" % rule.name)
+            self.rules[rule.name] = rule
+            for element in rule.elements:
+                if rule.key in self.dispatch[element]:
+                    raise ValueError("Rules %r and %r both clean %s tags of %ss" % (
+                        self.dispatch[element][rule.key].name, rule.name, rule.key,
+                        element))
+                self.dispatch[element][rule.key] = rule
+
+    def cleaner_options(self, cleaner):
+        """ Returns the options of the rule that uses the given cleaner (for
+            example the 'street_type' mapping), so scripts don't depend on
+            the rule's name. Raises ValueError unless exactly one rule uses it.
+        """
+        rules = [rule for rule in self.rules.values() if rule.cleaner == cleaner]
+        if len(rules) != 1:
+            raise ValueError("Expected one rule using cleaner %r, found %d"
+                             % (cleaner, len(rules)))
+        return rules[0].options
+
+    def stats(self):
+        """ Returns the counters of each rule, by rule name """
+        return dict((name, rule.stats()) for name, rule in self.rules.items())
+
+    def persist(self, cache_dir):
+        """ Loads each rule's cache from 'cache_dir' (as <rule name>.cache),
+            and makes save() write it back there
+        """
+        for name, rule in self.rules.items():
+            rule.cache.path = os.path.join(cache_dir, name + '.cache')
+            rule.cache.load()
+
+    def save(self):
+        """ Saves the caches given a path by persist() """
+        for rule in self.rules.values():
+            rule.cache.save()
+
+
+def load_rules(path=CONFIG_PATH):
+    """ Reads the rules from a JSON config file and compiles them into a
+        RuleSet. Each rule has a name, a tag key, a registered cleaner, and
+        optionally the element types it applies to (all by default), the
+        cleaner's options and the size of its cache. A top-level
+        'cache_size' sets the cache size of the rules that don't give one.
+    """
+    with open(path) as f:
+        config = json.load(f)
+    default_cache_size = config.get('cache_size', CACHE_SIZE)
+    rules = []
+    for rule_config in config['rules']:
+        factory = CLEANERS.get(rule_config['cleaner'])
+        if factory is None:
+            raise ValueError("Unknown cleaner %r in rule %r, expected one of %s" % (
+                rule_config['cleaner'], rule_config['name'], sorted(CLEANERS)))
+        options = rule_config.get('options', {})
+        function, fingerprint = factory(**options)
+        rules.append(CleaningRule(rule_config['name'], rule_config['key'],
+                                  rule_config.get('elements', ELEMENT_TYPES),
+                                  function, fingerprint, options,
+                                  rule_config['cleaner'],
+                                  rule_config.get('cache_size', default_cache_size)))
+    return RuleSet(rules)
+
+
+def print_report(rules):
+    """ Prints each rule's counters, timing and examples of dirty values """
+    pprint.pprint(rules.stats())
@@ -1,7 +1,8 @@
-import xml.etree.ElementTree as ET
 import pprint
 import re
 
+from osm_reader import get_element
+
 VANCOUVER_CITY_OSM = "/Users/nehaludyavar/Downloads/Vancouver_City_v2.osm"
 VANCOUVER_CITY_SAMPLE = "/Users/nehaludyavar/Downloads/Vancouver_City_Sample.osm"
 
@@ -13,20 +14,13 @@ def get_user(element):
 
 def process_map(filename):
     """ Iteratively parses through the OSM XML file, and if the element is a
-        node, way, or relation, calls the 'get_user' function. Then, if that
-        particular user is not in the array of users, it adds the user. Finally,
-        the array is assigned to a users set, and that set is returned.
+        node, way, or relation, calls the 'get_user' function and adds that
+        user to the users set, which is returned. For contribution counts, or
+        bounded memory on very big files, see user_analysis.py.
     """
-    users_array = []
-    for event, element in ET.iterparse(filename, events=("start", )):
-        if element.tag in ["node", "way", "relation"]:
-            user = get_user(element)
-            if user not in users_array:
-                users_array.append(user)
-            else:
-                pass
-
-    users = set(users_array)
+    users = set()
+    for element in get_element(filename, tags=("node", "way", "relation")):
+        users.add(get_user(element))
 
     return users
 
@@ -1,6 +1,7 @@
-import xml.etree.ElementTree as ET
 import pprint
 
+from osm_reader import get_element
+
 
 VANCOUVER_CITY_OSM = "/Users/nehaludyavar/Documents/Udacity Courses/P3 - Wrangle OpenStreetMap Data/" \
                      "Vancouver_City_v2.osm"
@@ -15,14 +16,15 @@ def count_tags(filename):
         Returns:
             dictionary: element tags
     """
-    tags = {}
-    for event, elem in ET.iterparse(filename, events=("start", )):
-        if elem.tag in tags.keys():
-            tag_field = "%s" % elem.tag
-            tags[tag_field] += 1
-        else:
-            tag_field = "%s" % elem.tag
-            tags[tag_field] = 1
+    elements = get_element(filename, tags=None, with_root=True)
+    root = next(elements)
+    tags = {root.tag: 1}
+    for element in elements:
+        for elem in element.iter():
+            if elem.tag in tags:
+                tags[elem.tag] += 1
+            else:
+                tags[elem.tag] = 1
 
     return tags
 
@@ -0,0 +1,100 @@
+import pprint
+
+CACHE_SIZE = 100000
+""" Maximum number of distinct tag keys kept in the cache """
+
+
+def classify(key, problem_chars, default_tag_type='regular'):
+    """ Splits a tag key the way shape_element stores it: the text before the
+        first colon is the tag type, and the rest is the key (for example,
+        'addr:street' is key 'street' of type 'addr'). Keys with more than two
+        colons keep their full name as the key.
+
+        Returns:
+            tuple: (key, type, True if the key has problem characters)
+    """
+    key_split = key.split(":")
+    if len(key_split) == 2:
+        tag_key = key_split[1]
+    elif len(key_split) == 3:
+        tag_key = key_split[1] + ":" + key_split[2]
+    else:
+        tag_key = key
+    if len(key_split) > 1:
+        tag_type = key_split[0]
+    else:
+        tag_type = default_tag_type
+    return tag_key, tag_type, problem_chars.search(key) is not None
+
+
+class KeyClassifier(object):
+    """ Memoizes 'classify' for each distinct tag key. OSM files use a small
+        vocabulary of keys over and over again, so almost every call is a
+        dictionary lookup. The cache is emptied once it holds 'max_size' keys,
+        which bounds its memory on files with unusually many distinct keys.
+    """
+
+    def __init__(self, problem_chars, max_size=CACHE_SIZE,
+                 default_tag_type='regular'):
+        self.problem_chars = problem_chars
+        self.max_size = max_size
+        self.default_tag_type = default_tag_type
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def classify(self, key):
+        try:
+            result = self.cache[key]
+            self.hits += 1
+            return result
+        except KeyError:
+            pass
+        self.misses += 1
+        result = classify(key, self.problem_chars, self.default_tag_type)
+        if len(self.cache) >= self.max_size:
+            self.cache.clear()
+        self.cache[key] = result
+        return result
+
+    def stats(self):
+        """ Returns the cache size, hits, misses and hit ratio """
+        calls = self.hits + self.misses
+        return {
+            'size': len(self.cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': float(self.hits) / calls if calls else 0.0
+        }
+
+
+# ================================ #
+#           Benchmark              #
+# ================================ #
+
+def benchmark(osm_file, repeat=3):
+    """ Times classifying every tag key in the file with the uncached function
+        and with the classifier, and returns the time per tag of each.
+    """
+    from osm_reader import get_element
+    from preparing_for_database import PROBLEMCHARS
+    from benchmark import best_time
+
+    keys = [tag.attrib['k']
+            for element in get_element(osm_file, tags=('node', 'way'))
+            for tag in element.iter('tag')]
+
+    classifier = KeyClassifier(PROBLEMCHARS)
+    uncached, _ = best_time(lambda: [classify(key, PROBLEMCHARS) for key in keys],
+                            repeat)
+    cached, _ = best_time(lambda: map(classifier.classify, keys), repeat)
+    results = {
+        'tags': len(keys),
+        'distinct_keys': len(set(keys)),
+        'uncached_ns_per_tag': 1e9 * uncached / len(keys),
+        'cached_ns_per_tag': 1e9 * cached / len(keys),
+        'speedup': uncached / cached,
+        'cache': classifier.stats()
+    }
+    pprint.pprint(results)
+    return results
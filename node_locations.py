@@ -0,0 +1,225 @@
+from array import array
+from bisect import bisect_left
+import mmap
+import os
+import pprint
+import sqlite3
+import struct
+import tempfile
+import time
+
+from spatial_index import distance
+
+COORDINATE_SCALE = 10 ** 7
+""" Coordinates are stored as integers in units of 1e-7 degrees, the
+    precision of OSM coordinates
+"""
+
+RECORD = struct.Struct('<II')
+""" One node in the dense store: latitude and longitude as unsigned integers,
+    offset so that a real coordinate is never 0, which marks a missing node
+"""
+LAT_OFFSET = 90 * COORDINATE_SCALE + 1
+LON_OFFSET = 180 * COORDINATE_SCALE + 1
+
+GROW_NODES = 1 << 20
+""" The dense store grows in steps of at least this many node ids (8 MB) """
+
+WAY_GEOMETRY_FIELDS = ['id', 'length', 'min_lat', 'min_lon', 'max_lat', 'max_lon',
+                       'nodes', 'missing_nodes']
+""" Header of ways_geometry.csv. The length is in metres, and missing_nodes
+    counts the way's nodes that aren't in the file (as at the edge of an
+    extract), which are left out of the length and bounding box.
+"""
+
+
+def to_fixed(value):
+    return int(round(float(value) * COORDINATE_SCALE))
+
+
+class DenseLocations(object):
+    """ Node coordinates in a memory-mapped file with one 8-byte record per
+        node id, so a node is found by its id alone. The file is sparse:
+        only the pages holding nodes that exist take disk space and memory,
+        and the operating system pages them in and out as needed, so memory
+        stays flat however many nodes there are.
+
+        Each node touches its own page unless node ids are close together,
+        as they are in a country or planet file. For a city extract, whose
+        nodes are thousands of ids apart, SparseLocations is much faster.
+
+        Without a path the file is temporary and removed by close().
+    """
+
+    def __init__(self, path=None):
+        self.temporary = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix='.locations')
+            os.close(fd)
+        self.path = path
+        self.file = open(path, 'w+b')
+        self.size = 0
+        self.map = None
+        self.grow(GROW_NODES)
+
+    def grow(self, num_nodes):
+        """ Makes room for node ids below 'num_nodes' """
+        if self.map is not None:
+            self.map.close()
+        self.size = num_nodes
+        self.file.truncate(num_nodes * RECORD.size)
+        self.map = mmap.mmap(self.file.fileno(), num_nodes * RECORD.size)
+
+    def set(self, node_id, lat, lon):
+        if node_id >= self.size:
+            wanted = max(node_id + 1, self.size + self.size // 4)
+            self.grow((wanted // GROW_NODES + 1) * GROW_NODES)
+        RECORD.pack_into(self.map, node_id * RECORD.size,
+                         to_fixed(lat) + LAT_OFFSET, to_fixed(lon) + LON_OFFSET)
+
+    def get(self, node_id):
+        """ Returns the node's (lat, lon), or None if it isn't stored """
+        if node_id >= self.size:
+            return None
+        lat, lon = RECORD.unpack_from(self.map, node_id * RECORD.size)
+        if not lat:
+            return None
+        return (float(lat - LAT_OFFSET) / COORDINATE_SCALE,
+                float(lon - LON_OFFSET) / COORDINATE_SCALE)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+        if self.temporary:
+            os.remove(self.path)
+
+
+class SparseLocations(object):
+    """ Node coordinates in three in-memory arrays (ids, latitudes and
+        longitudes, 16 bytes per node), looked up by binary search. Best for
+        extracts, whose node ids are far apart. OSM files list nodes by id, so
+        the arrays are normally sorted already; if not, they are sorted
+        before the first lookup.
+    """
+
+    def __init__(self):
+        self.ids = array('l')
+        self.lats = array('i')
+        self.lons = array('i')
+        self.sorted = True
+
+    def set(self, node_id, lat, lon):
+        if self.ids and node_id <= self.ids[-1]:
+            self.sorted = False
+        self.ids.append(node_id)
+        self.lats.append(to_fixed(lat))
+        self.lons.append(to_fixed(lon))
+
+    def sort(self):
+        order = sorted(range(len(self.ids)), key=self.ids.__getitem__)
+        self.ids = array('l', [self.ids[i] for i in order])
+        self.lats = array('i', [self.lats[i] for i in order])
+        self.lons = array('i', [self.lons[i] for i in order])
+        self.sorted = True
+
+    def get(self, node_id):
+        """ Returns the node's (lat, lon), or None if it isn't stored """
+        if not self.sorted:
+            self.sort()
+        i = bisect_left(self.ids, node_id)
+        if i == len(self.ids) or self.ids[i] != node_id:
+            return None
+        return (float(self.lats[i]) / COORDINATE_SCALE,
+                float(self.lons[i]) / COORDINATE_SCALE)
+
+    def close(self):
+        pass
+
+
+def node_locations(kind='sparse', path=None):
+    """ Returns an empty node location store: 'sparse' (SparseLocations) or
+        'dense' (DenseLocations, in a file at 'path' or a temporary one)
+    """
+    if kind == 'dense':
+        return DenseLocations(path)
+    elif kind == 'sparse':
+        return SparseLocations()
+    raise ValueError("Unknown node location store %r" % kind)
+
+
+def way_geometry(node_ids, locations):
+    """ Returns the coordinates of a way's nodes, as (lat, lon) tuples, from a
+        node location store. Nodes that aren't in it are left out.
+    """
+    get = locations.get
+    return [location for location in map(get, node_ids) if location is not None]
+
+
+def way_geometry_row(way_id, node_ids, locations):
+    """ Returns the ways_geometry.csv row of a way (see WAY_GEOMETRY_FIELDS) """
+    coordinates = way_geometry(node_ids, locations)
+    length = 0.0
+    for (lat1, lon1), (lat2, lon2) in zip(coordinates, coordinates[1:]):
+        length += distance(lat1, lon1, lat2, lon2)
+    if coordinates:
+        lats, lons = zip(*coordinates)
+        bbox = (min(lats), min(lons), max(lats), max(lons))
+    else:
+        bbox = (None, None, None, None)
+    return ((int(way_id), round(length, 2)) + bbox +
+            (len(node_ids), len(node_ids) - len(coordinates)))
+
+
+# ================================ #
+#           Benchmark              #
+# ================================ #
+
+def way_geometries(osm_file, kind='sparse'):
+    """ Yields the geometry row of every way in the file, in one pass """
+    from osm_reader import get_element
+
+    locations = node_locations(kind)
+    try:
+        for element in get_element(osm_file, tags=('node', 'way')):
+            if element.tag == 'node':
+                locations.set(int(element.attrib['id']), element.attrib['lat'],
+                              element.attrib['lon'])
+            else:
+                node_ids = [int(child.attrib['ref']) for child in element
+                            if child.tag == 'nd']
+                yield way_geometry_row(element.attrib['id'], node_ids, locations)
+    finally:
+        locations.close()
+
+
+def benchmark(osm_file, sqlite_file):
+    """ Times building the bounding box of every way in one pass over the
+        file, with each node location store, and with a join of ways_nodes
+        and nodes in a database built from the same file. Checks that they
+        agree.
+    """
+    results = {}
+    boxes = {}
+    for kind in ('dense', 'sparse'):
+        start = time.time()
+        boxes[kind] = dict((row[0], row[2:6]) for row in way_geometries(osm_file, kind)
+                           if row[2] is not None)
+        results[kind + '_seconds'] = time.time() - start
+
+    conn = sqlite3.connect(sqlite_file)
+    start = time.time()
+    rows = conn.execute("SELECT w.id, MIN(n.lat), MIN(n.lon), MAX(n.lat), MAX(n.lon) "
+                        "FROM ways_nodes w JOIN nodes n ON n.id = w.node_id "
+                        "GROUP BY w.id").fetchall()
+    results['sql_seconds'] = time.time() - start
+    conn.close()
+
+    sql_boxes = dict((row[0], row[1:]) for row in rows)
+    results['ways'] = len(boxes['dense'])
+    results['same_boxes'] = (boxes['dense'] == boxes['sparse'] and
+                             sorted(boxes['dense']) == sorted(sql_boxes) and
+                             all(abs(a - b) < 1e-9
+                                 for way_id, box in sql_boxes.items()
+                                 for a, b in zip(box, boxes['dense'][way_id])))
+    pprint.pprint(results)
+    return results
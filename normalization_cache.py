@@ -0,0 +1,81 @@
+from collections import OrderedDict
+import json
+import os
+
+CACHE_SIZE = 50000
+""" Default number of distinct values kept by each cache """
+
+
+class NormalizationCache(object):
+    """ Least-recently-used cache around a function of one string value, such
+        as a street name or postcode cleaner. Street names and postcodes repeat
+        a lot across nodes and ways, so most values are only cleaned once.
+
+        If 'path' is given the cache can be saved to (and is loaded from) that
+        file, as JSON, so it survives between runs. The 'fingerprint' should
+        change whenever the cleaning rules do (for example the street type
+        mapping), so that a cache saved with old rules is ignored. It must be
+        made of JSON types (tuples are compared as lists).
+    """
+
+    def __init__(self, function, max_size=CACHE_SIZE, path=None, fingerprint=None):
+        self.function = function
+        self.max_size = max_size
+        self.path = path
+        self.fingerprint = fingerprint
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None:
+            self.load()
+
+    def __call__(self, value):
+        cache = self.cache
+        try:
+            result = cache.pop(value)
+        except KeyError:
+            self.misses += 1
+            result = self.function(value)
+            if len(cache) >= self.max_size:
+                cache.popitem(last=False)       # Evicts the least recently used
+        else:
+            self.hits += 1
+        cache[value] = result
+        return result
+
+    def stats(self):
+        """ Returns the cache size, hits, misses and hit ratio """
+        calls = self.hits + self.misses
+        return {
+            'size': len(self.cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': float(self.hits) / calls if calls else 0.0
+        }
+
+    def load(self):
+        """ Loads the cache saved at 'path', unless it doesn't exist, isn't a
+            saved cache (such as one pickled by older versions) or was saved
+            with a different fingerprint.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            try:
+                saved = json.load(f)
+                fingerprint, items = saved['fingerprint'], saved['items']
+            except (ValueError, TypeError, KeyError):
+                return
+        if fingerprint == json.loads(json.dumps(self.fingerprint)):
+            self.cache = OrderedDict((value, result)
+                                     for value, result in items[-self.max_size:])
+
+    def save(self):
+        """ Saves the cache to 'path' (does nothing if there is no path) """
+        if self.path is None:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            json.dump({'fingerprint': self.fingerprint,
+                       'items': self.cache.items()}, f)
+        os.rename(tmp_path, self.path)
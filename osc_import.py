@@ -0,0 +1,284 @@
+import xml.etree.cElementTree as ET
+import os
+import pprint
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from osm_reader import DecompressingReader, is_compressed
+from preparing_for_database import shape_element, validate_element
+from schema_compiler import FastValidator
+from spatial_index import index_node, spatial_index_kind, unindex_node
+from sql_schema import SHAPED_TABLES, create_tags_pivot, insert_sql, \
+    table_columns, update_tags_pivot
+from sqlite_loader import BATCH_SIZE, connect, load_osm, number_converters, \
+    table_rows
+
+ACTIONS = ('create', 'modify', 'delete')
+""" The blocks of an osmChange file """
+
+ELEMENT_TABLES = {
+    'node': ('nodes', ['nodes_tags']),
+    'way': ('ways', ['ways_tags', 'ways_nodes']),
+    'relation': ('relations', ['relation_tags', 'relation_members'])
+}
+""" The table of each element type, and the tables of its child rows (which
+    all have the element id in their 'id' column)
+"""
+
+UPDATE_PRAGMAS = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'NORMAL'
+}
+""" Unlike a bulk load, an update changes a database that can't simply be
+    rebuilt, so the rollback journal stays on.
+"""
+
+
+def change_elements(osc_file):
+    """ Iteratively parses an osmChange file and yields (action, element)
+        for each element of its create, modify and delete blocks, once the
+        element has been fully parsed. The action is tracked from the start
+        of its block, and each block is cleared after every element, so
+        memory stays flat however big a block is. A path ending in .bz2 or
+        .gz is decompressed on the fly.
+    """
+    source = DecompressingReader(osc_file) if is_compressed(osc_file) else osc_file
+    try:
+        context = ET.iterparse(source, events=('start', 'end'))
+        _, root = next(context)
+        depth = 1
+        action = None
+        for event, elem in context:
+            if event == 'start':
+                depth += 1
+                if depth == 2:
+                    action = elem
+                continue
+            depth -= 1
+            if depth == 2 and action.tag in ACTIONS:
+                yield action.tag, elem
+                action.clear()
+            elif depth == 1:
+                root.clear()
+    finally:
+        if source is not osc_file:
+            source.close()
+
+
+class ChangeApplier(object):
+    """ Applies the elements of an osmChange file to the SQLite tables. An
+        element that is created or modified replaces its row and all of its
+        tags, way nodes or relation members; a deleted element is removed with them. Nodes are
+        also moved in (or removed from) the spatial index. Applying
+        the same change twice gives the same result.
+
+        With 'tags_pivot', the elements applied are collected in 'touched'
+        so that their tags_pivot rows can be updated.
+    """
+
+    def __init__(self, conn, validate=False, tags_pivot=False):
+        self.cur = conn.cursor()
+        self.spatial_index = spatial_index_kind(conn)
+        self.validate = validate
+        self.validator = FastValidator()
+        self.columns = {}
+        self.converters = {}
+        self.statements = {}
+        for table_name in SHAPED_TABLES.values():
+            self.columns[table_name] = table_columns(table_name)
+            self.converters[table_name] = number_converters(table_name)
+            self.statements[table_name] = insert_sql(table_name, or_replace=True)
+        self.counts = dict((action, 0) for action in ACTIONS)
+        self.skipped = 0
+        self.tags_pivot = tags_pivot
+        self.touched = set()
+
+    def delete(self, tag, element_id):
+        """ Removes an element and its child rows """
+        table_name, child_tables = ELEMENT_TABLES[tag]
+        for child_table in child_tables:
+            self.cur.execute("DELETE FROM %s WHERE id = ?" % child_table,
+                             (element_id,))
+        self.cur.execute("DELETE FROM %s WHERE id = ?" % table_name, (element_id,))
+        if tag == 'node':
+            unindex_node(self.cur, self.spatial_index, element_id)
+
+    def replace(self, element):
+        """ Shapes an element (cleaning street names and postal codes as
+            process_map does) and replaces its rows
+        """
+        el = shape_element(element, compact_way_nodes=True)
+        if self.validate is True:
+            validate_element(el, self.validator)
+        _, child_tables = ELEMENT_TABLES[element.tag]
+        for child_table in child_tables:
+            self.cur.execute("DELETE FROM %s WHERE id = ?" % child_table,
+                             (element.attrib['id'],))
+        for key, value in el.iteritems():
+            table_name = SHAPED_TABLES[key]
+            self.cur.executemany(self.statements[table_name],
+                                 table_rows(value, self.columns[table_name],
+                                            self.converters[table_name]))
+        if element.tag == 'node':
+            node = el['node']
+            index_node(self.cur, self.spatial_index, node['id'], node['lat'],
+                       node['lon'])
+
+    def apply(self, action, element):
+        """ Applies one element of a create, modify or delete block. Returns
+            True if it was applied, or False if it was skipped (not a node,
+            way or relation).
+        """
+        if element.tag not in ELEMENT_TABLES:
+            self.skipped += 1
+            return False
+        if action == 'delete':
+            self.delete(element.tag, element.attrib['id'])
+        else:
+            self.replace(element)
+        if self.tags_pivot:
+            self.touched.add((element.tag, element.attrib['id']))
+        self.counts[action] += 1
+        return True
+
+    def commit(self):
+        """ Updates the tags_pivot rows of the elements applied since the last
+            commit, then commits them
+        """
+        if self.touched:
+            update_tags_pivot(self.cur.connection, self.touched)
+            self.touched = set()
+        self.cur.execute("COMMIT")
+
+
+def apply_osc(osc_file, sqlite_file, validate=False, batch_size=BATCH_SIZE,
+              pragmas=None):
+    """ Applies an osmChange (.osc) diff to a database built by load_osm or
+        import_csvs, in place. The diff is streamed (see change_elements) and
+        changes are applied in file order, committing every 'batch_size'
+        elements, and the indexes are kept up to date. If the database has a
+        tags_pivot table, the rows of the elements changed are updated in
+        the same transactions.
+
+        Returns:
+            dictionary: elements created, modified and deleted, elements
+            skipped (not a node, way or relation) and seconds.
+    """
+    start = time.time()
+    settings = dict(UPDATE_PRAGMAS)
+    settings.update(pragmas or {})
+    conn = connect(sqlite_file, settings)
+    has_pivot = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'tags_pivot'").fetchone() is not None
+    applier = ChangeApplier(conn, validate, tags_pivot=has_pivot)
+
+    conn.execute("BEGIN")
+    pending = 0
+    for action, element in change_elements(osc_file):
+        pending += applier.apply(action, element)
+        if pending >= batch_size:
+            applier.commit()
+            conn.execute("BEGIN")
+            pending = 0
+    applier.commit()
+    conn.close()
+
+    report = dict(applier.counts)
+    report['skipped'] = applier.skipped
+    report['seconds'] = time.time() - start
+    pprint.pprint(report)
+    return report
+
+
+# ================================ #
+#           Test                   #
+# ================================ #
+
+TEST_OSM = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+ <node id="1" lat="49.28" lon="-123.12" user="a" uid="1" version="1" changeset="1" timestamp="2016-01-01T00:00:00Z">
+  <tag k="amenity" v="cafe"/>
+  <tag k="name" v="Old Cafe"/>
+ </node>
+ <node id="2" lat="49.29" lon="-123.13" user="a" uid="1" version="1" changeset="1" timestamp="2016-01-01T00:00:00Z">
+  <tag k="amenity" v="bench"/>
+ </node>
+ <way id="3" user="a" uid="1" version="1" changeset="1" timestamp="2016-01-01T00:00:00Z">
+  <nd ref="1"/>
+  <nd ref="2"/>
+  <tag k="name" v="Main Street"/>
+ </way>
+</osm>
+"""
+
+TEST_OSC = """<?xml version="1.0" encoding="UTF-8"?>
+<osmChange version="0.6">
+ <modify>
+  <node id="1" lat="49.28" lon="-123.12" user="b" uid="2" version="2" changeset="2" timestamp="2016-02-01T00:00:00Z">
+   <tag k="amenity" v="restaurant"/>
+   <tag k="cuisine" v="sushi"/>
+   <tag k="addr:street" v="Beatty St"/>
+  </node>
+ </modify>
+ <delete>
+  <node id="2" lat="49.29" lon="-123.13" user="b" uid="2" version="2" changeset="2" timestamp="2016-02-01T00:00:00Z"/>
+ </delete>
+ <create>
+  <node id="4" lat="49.30" lon="-123.14" user="b" uid="2" version="1" changeset="2" timestamp="2016-02-01T00:00:00Z">
+   <tag k="amenity" v="cafe"/>
+  </node>
+  <way id="5" user="b" uid="2" version="1" changeset="2" timestamp="2016-02-01T00:00:00Z">
+   <nd ref="1"/>
+   <nd ref="4"/>
+   <tag k="bad key?" v="problem key"/>
+   <tag k="name" v="New Street"/>
+  </way>
+  <changeset id="6"/>
+ </create>
+</osmChange>
+"""
+""" A small database, and a diff that modifies, deletes and creates elements
+    (including a tag whose key has problem characters and a changeset, which
+    is skipped)
+"""
+
+
+def test():
+    """ Applies TEST_OSC, one element per transaction, to a database loaded
+        from TEST_OSM with a tags_pivot. Checks the elements, and that the
+        updated tags_pivot is the same as one rebuilt from scratch.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        osm_file = os.path.join(tmp_dir, 'test.osm')
+        osc_file = os.path.join(tmp_dir, 'test.osc')
+        sqlite_file = os.path.join(tmp_dir, 'test.db')
+        with open(osm_file, 'w') as f:
+            f.write(TEST_OSM)
+        with open(osc_file, 'w') as f:
+            f.write(TEST_OSC)
+        load_osm(osm_file, sqlite_file, tags_pivot=True)
+        report = apply_osc(osc_file, sqlite_file, batch_size=1)
+        assert (report['create'], report['modify'], report['delete'],
+                report['skipped']) == (2, 1, 1, 1), report
+
+        conn = sqlite3.connect(sqlite_file)
+        assert conn.execute("SELECT id, user FROM nodes ORDER BY id").fetchall() == \
+            [(1, 'b'), (4, 'b')]
+        assert conn.execute("SELECT value FROM nodes_tags WHERE id = 1 AND "
+                            "key = 'street'").fetchall() == [('Beatty Street',)]
+        assert conn.execute("SELECT key, value FROM ways_tags WHERE id = 5 "
+                            "ORDER BY value").fetchall() == \
+            [('name', 'New Street'), (None, 'problem key')]
+        updated = conn.execute("SELECT * FROM tags_pivot ORDER BY element, id").fetchall()
+        create_tags_pivot(conn)
+        rebuilt = conn.execute("SELECT * FROM tags_pivot ORDER BY element, id").fetchall()
+        conn.close()
+        assert updated == rebuilt, (updated, rebuilt)
+        assert [(element, element_id) for element, element_id in
+                (row[:2] for row in updated)] == \
+            [('node', 1), ('node', 4), ('way', 3), ('way', 5)]
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,393 @@
+import xml.etree.cElementTree as ET
+import bz2
+import multiprocessing
+import os
+import pprint
+import Queue
+import re
+import resource
+import shutil
+import tempfile
+import threading
+import zlib
+
+ELEMENT_START = re.compile(r'<(node|way|relation)[\s/>]')
+""" Regex for the start of a top-level OSM element. Since '<' can't appear
+    unescaped inside an attribute value, any match is a real element boundary.
+"""
+BLOCK_SIZE = 1 << 16
+
+COMPRESSED_EXTENSIONS = ('.bz2', '.gz')
+QUEUED_BLOCKS = 16
+""" Decompressed blocks the decompression thread may get ahead of the parser """
+
+
+PARSERS = ('etree', 'lxml')
+""" Parser backends of get_element:
+    etree: cElementTree's iterparse (the default).
+    lxml: lxml's iterparse, if lxml is installed, filtered in C to the
+        wanted tags. It parses about 1.45 times as fast as etree (0.32s
+        against 0.46s for the 124k elements of a 25 MB extract, and 15ms
+        against 23ms for the bundled sample), but shaping its elements is
+        slower, so process_map only gains about 2%.
+    The 2-5x parse speedup first aimed for isn't reachable from Python: on
+    the sample, lxml building the whole tree with no Python loop takes about
+    25ms, and expat with an empty Python start handler about 30ms, against
+    about 44ms for etree's get_element with an audit's tag loop. Yielding
+    (tag, attributes, tag pairs) tuples instead of elements, from either
+    parser, measured only 1.3-1.4 times as fast, so auditors keep using
+    get_element.
+"""
+DEFAULT_PARSER = 'etree'
+
+
+def get_element(osm_file, tags=('node', 'way', 'relation'), with_root=False,
+                parser=DEFAULT_PARSER):
+    """ Iteratively parses the OSM XML file and yields each top-level element
+        (a direct child of the root, such as a node, way or relation) once it
+        has been fully parsed, so its child tags are available. After each
+        element is yielded the root is cleared, which keeps memory flat no
+        matter how big the file is.
+
+        If 'tags' is None every top-level element is yielded. If 'with_root'
+        is True the root element itself is yielded first (before any of its
+        children have been parsed). 'parser' picks the backend, see PARSERS.
+
+        A path ending in .bz2 or .gz is decompressed on the fly, see
+        DecompressingReader.
+    """
+    if is_compressed(osm_file):
+        return compressed_elements(osm_file, tags, with_root, parser)
+    elif parser == 'etree':
+        return iterparse_elements(ET.iterparse, osm_file, tags, with_root)
+    elif parser == 'lxml':
+        from lxml import etree
+        if tags is None or with_root:
+            return iterparse_elements(etree.iterparse, osm_file, tags, with_root)
+        return lxml_elements(etree, osm_file, tags)
+    raise ValueError("Unknown parser %r, expected one of %s" % (parser, PARSERS))
+
+
+def iterparse_elements(iterparse, osm_file, tags, with_root):
+    """ get_element over an ElementTree-style iterparse function """
+    context = iterparse(osm_file, events=('start', 'end'))
+    _, root = next(context)
+    if with_root:
+        yield root
+
+    depth = 1
+    for event, elem in context:
+        if event == 'start':
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1:
+            if tags is None or elem.tag in tags:
+                yield elem
+            root.clear()
+
+
+def lxml_elements(etree, osm_file, tags):
+    """ get_element with lxml's iterparse, which only reports the end of the
+        wanted tags (and of every node, way and relation, so that unwanted
+        ones are dropped as they go), so the Python loop never sees the
+        elements' own children. Each element is cleared once it has been
+        seen, along with its earlier siblings.
+    """
+    reported = set(tags) | set(('node', 'way', 'relation'))
+    for _, elem in etree.iterparse(osm_file, events=('end',), tag=reported):
+        parent = elem.getparent()
+        if parent is None or parent.getparent() is not None:
+            continue                    # Not a direct child of the root
+        if elem.tag in tags:
+            yield elem
+        elem.clear()
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+# ================================ #
+#           Compressed Input       #
+# ================================ #
+
+def is_compressed(osm_file):
+    return isinstance(osm_file, basestring) and osm_file.endswith(COMPRESSED_EXTENSIONS)
+
+
+def decompressor(osm_file):
+    if osm_file.endswith('.bz2'):
+        return bz2.BZ2Decompressor()
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)     # gzip header and trailer
+
+
+class DecompressingReader(object):
+    """ Read-only file object over the decompressed contents of a .bz2 or .gz
+        file. A background thread reads and decompresses the file while the
+        caller parses what has already been decompressed (both bz2 and zlib
+        release the GIL while they work), so decompression overlaps with
+        parsing and shaping and nothing is written to disk. Files made of
+        several compressed streams one after the other (as written by pbzip2
+        or by concatenating .gz files) are read to the end.
+    """
+
+    def __init__(self, osm_file):
+        self.osm_file = osm_file
+        self.blocks = Queue.Queue(QUEUED_BLOCKS)
+        self.stopped = threading.Event()
+        self.block = ''
+        self.position = 0
+        self.finished = False
+        self.thread = threading.Thread(target=self._decompress)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _put(self, item):
+        """ Queues an item, unless the reader is closed first """
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _decompress(self):
+        try:
+            with open(self.osm_file, 'rb') as f:
+                stream = decompressor(self.osm_file)
+                while True:
+                    data = f.read(BLOCK_SIZE)
+                    if not data:
+                        break
+                    while data:
+                        try:
+                            block = stream.decompress(data)
+                        except EOFError:
+                            # The previous bz2 stream ended with the last block
+                            stream = decompressor(self.osm_file)
+                            continue
+                        if block and not self._put(block):
+                            return
+                        data = stream.unused_data
+                        if data:
+                            stream = decompressor(self.osm_file)
+                if hasattr(stream, 'flush'):
+                    block = stream.flush()
+                    if block and not self._put(block):
+                        return
+        except Exception as e:
+            self._put(e)
+            return
+        self._put(None)
+
+    def _next_block(self):
+        """ Waits for the next decompressed block. Returns False at the end of
+            the file, and raises any error of the decompression thread.
+        """
+        if self.finished:
+            return False
+        block = self.blocks.get()
+        if block is None or isinstance(block, Exception):
+            self.finished = True
+            if block is not None:
+                raise block
+            return False
+        self.block = block
+        self.position = 0
+        return True
+
+    def read(self, size=-1):
+        chunks = []
+        while size != 0:
+            if self.position >= len(self.block) and not self._next_block():
+                break
+            if size < 0:
+                chunk = self.block[self.position:]
+            else:
+                chunk = self.block[self.position:self.position + size]
+                size -= len(chunk)
+            self.position += len(chunk)
+            chunks.append(chunk)
+        return ''.join(chunks)
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+def compressed_elements(osm_file, tags, with_root, parser):
+    """ get_element over a .bz2 or .gz file """
+    source = DecompressingReader(osm_file)
+    try:
+        for elem in get_element(source, tags, with_root, parser):
+            yield elem
+    finally:
+        source.close()
+
+
+# ================================ #
+#           Byte Ranges            #
+# ================================ #
+
+def find_element_start(osm_file, offset, end=None):
+    """ Returns the byte offset of the first node, way or relation element that
+        starts at or after 'offset' (and before 'end'), or None if there isn't
+        one.
+    """
+    with open(osm_file, 'rb') as f:
+        f.seek(offset)
+        position = offset
+        carry = ''
+        while end is None or position < end:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                return None
+            data = carry + block
+            m = ELEMENT_START.search(data)
+            if m:
+                start = position - len(carry) + m.start()
+                if end is not None and start >= end:
+                    return None
+                return start
+            carry = data[-16:]
+            position += len(block)
+    return None
+
+
+def find_root_end(osm_file):
+    """ Returns the byte offset of the closing tag of the root element """
+    size = os.path.getsize(osm_file)
+    with open(osm_file, 'rb') as f:
+        f.seek(max(0, size - 4096))
+        tail = f.read()
+    return size - len(tail) + tail.rindex('</')
+
+
+def split_ranges(osm_file, num_ranges, offset=0):
+    """ Splits the OSM file into at most 'num_ranges' (start, end) byte ranges
+        of roughly equal size, each beginning on a node, way or relation
+        element. Together the ranges cover every top-level element in order
+        (the root tag and anything before the first node are left out).
+        With an 'offset', only the elements starting at or after it are
+        covered.
+
+        Compressed files can't be split, since their byte offsets don't map
+        to offsets in the XML.
+    """
+    if is_compressed(osm_file):
+        raise ValueError("Can't split compressed file %s into byte ranges, "
+                         "decompress it first" % osm_file)
+    end = find_root_end(osm_file)
+    first = find_element_start(osm_file, offset, end)
+    if first is None:
+        return []
+
+    offsets = [first]
+    for i in range(1, num_ranges):
+        guess = first + (end - first) * i // num_ranges
+        if guess <= offsets[-1]:
+            continue
+        start = find_element_start(osm_file, guess, end)
+        if start is None:
+            break
+        if start > offsets[-1]:
+            offsets.append(start)
+    offsets.append(end)
+    return zip(offsets[:-1], offsets[1:])
+
+
+class RangeFile(object):
+    """ Read-only file object over the bytes [start, end) of an OSM file,
+        wrapped in an <osm> root so that it can be parsed on its own.
+    """
+
+    def __init__(self, osm_file, start, end):
+        self.file = open(osm_file, 'rb')
+        self.file.seek(start)
+        self.remaining = end - start
+        self.prefix = '<osm>'
+        self.suffix = '</osm>'
+
+    def read(self, size=-1):
+        if size < 0:
+            size = self.remaining + len(self.prefix) + len(self.suffix)
+        data = self.prefix[:size]
+        self.prefix = self.prefix[len(data):]
+        if len(data) < size and self.remaining > 0:
+            block = self.file.read(min(size - len(data), self.remaining))
+            self.remaining -= len(block)
+            data += block
+        if len(data) < size and self.remaining == 0:
+            end = self.suffix[:size - len(data)]
+            self.suffix = self.suffix[len(end):]
+            data += end
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def get_range_element(osm_file, start, end, tags=('node', 'way', 'relation'),
+                      parser=DEFAULT_PARSER):
+    """ Same as 'get_element', but only over the elements in one byte range
+        returned by 'split_ranges'.
+    """
+    range_file = RangeFile(osm_file, start, end)
+    try:
+        for elem in get_element(range_file, tags, parser=parser):
+            yield elem
+    finally:
+        range_file.close()
+
+
+# ================================ #
+#           Memory Test            #
+# ================================ #
+
+def write_synthetic_osm(filename, num_nodes):
+    """ Writes an OSM file with 'num_nodes' tagged nodes, for memory tests """
+    with open(filename, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm>\n')
+        for i in xrange(num_nodes):
+            f.write('<node changeset="1" id="%d" lat="49.25" lon="-123.1" '
+                    'timestamp="2015-04-26T08:22:54Z" uid="1" user="test" '
+                    'version="1">\n\t<tag k="addr:street" v="Main St" />\n'
+                    '</node>\n' % i)
+        f.write('</osm>\n')
+
+
+def _peak_memory(filename, queue):
+    for _ in get_element(filename, tags=None):
+        pass
+    queue.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def peak_memory(filename):
+    """ Returns the peak RSS of a fresh process that reads the whole file """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_peak_memory, args=(filename, queue))
+    process.start()
+    peak = queue.get()
+    process.join()
+    return peak
+
+
+def test_memory(num_nodes=100000, scale=10, tolerance=1.25):
+    """ Checks that peak memory stays flat as the file grows: reading a file
+        'scale' times bigger should not use more than 'tolerance' times the
+        memory.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        small = os.path.join(tmp_dir, 'small.osm')
+        large = os.path.join(tmp_dir, 'large.osm')
+        write_synthetic_osm(small, num_nodes)
+        write_synthetic_osm(large, num_nodes * scale)
+        small_peak = peak_memory(small)
+        large_peak = peak_memory(large)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    pprint.pprint({'small_peak': small_peak, 'large_peak': large_peak})
+    assert large_peak <= small_peak * tolerance, \
+        "Peak memory grew from %d to %d" % (small_peak, large_peak)
@@ -0,0 +1,138 @@
+import codecs
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from block_writer import BlockWriter
+from osm_reader import get_range_element, is_compressed, split_ranges
+from schema_compiler import FastValidator
+from preparing_for_database import process_map, shape_element, validate_element, \
+    NODES_PATH, NODES_TAG_PATH, WAYS_PATH, WAY_NODES_PATH, \
+    WAY_TAGS_PATH, RELATIONS_PATH, RELATION_MEMBERS_PATH, RELATION_TAGS_PATH, \
+    NODE_FIELDS, NODE_TAG_FIELDS, WAY_FIELDS, WAY_NODES_FIELDS, WAY_TAGS_FIELDS, \
+    RELATION_FIELDS, RELATION_MEMBERS_FIELDS, RELATION_TAGS_FIELDS
+
+OUTPUTS = [
+    (NODES_PATH, NODE_FIELDS),
+    (NODES_TAG_PATH, NODE_TAG_FIELDS),
+    (WAYS_PATH, WAY_FIELDS),
+    (WAY_NODES_PATH, WAY_NODES_FIELDS),
+    (WAY_TAGS_PATH, WAY_TAGS_FIELDS),
+    (RELATIONS_PATH, RELATION_FIELDS),
+    (RELATION_MEMBERS_PATH, RELATION_MEMBERS_FIELDS),
+    (RELATION_TAGS_PATH, RELATION_TAGS_FIELDS)
+]
+""" The CSV files written by process_map, with their headers """
+
+RANGES_PER_PROCESS = 4
+""" Each process gets a few ranges so that a slow range doesn't hold up the
+    whole pool.
+"""
+
+
+def part_path(tmp_dir, index, path):
+    """ Returns the path of one range's part of a CSV file """
+    return os.path.join(tmp_dir, "%06d-%s" % (index, os.path.basename(path)))
+
+
+def process_range(args):
+    """ Shapes every node, way and relation in one byte range of the OSM file and writes
+        them, without headers, to that range's part of each CSV file.
+    """
+    file_in, start, end, index, tmp_dir, validate = args
+
+    with codecs.open(part_path(tmp_dir, index, NODES_PATH), 'w') as nodes_file, \
+         codecs.open(part_path(tmp_dir, index, NODES_TAG_PATH), 'w') as nodes_tags_file, \
+         codecs.open(part_path(tmp_dir, index, WAYS_PATH), 'w') as ways_file, \
+         codecs.open(part_path(tmp_dir, index, WAY_NODES_PATH), 'w') as way_nodes_file, \
+         codecs.open(part_path(tmp_dir, index, WAY_TAGS_PATH), 'w') as way_tags_file, \
+         codecs.open(part_path(tmp_dir, index, RELATIONS_PATH), 'w') as relations_file, \
+         codecs.open(part_path(tmp_dir, index, RELATION_MEMBERS_PATH), 'w') as relation_members_file, \
+         codecs.open(part_path(tmp_dir, index, RELATION_TAGS_PATH), 'w') as relation_tags_file:
+
+        nodes_writer = BlockWriter(nodes_file, NODE_FIELDS)
+        nodes_tags_writer = BlockWriter(nodes_tags_file, NODE_TAG_FIELDS)
+        ways_writer = BlockWriter(ways_file, WAY_FIELDS)
+        way_nodes_writer = BlockWriter(way_nodes_file, WAY_NODES_FIELDS)
+        way_tags_writer = BlockWriter(way_tags_file, WAY_TAGS_FIELDS)
+        relations_writer = BlockWriter(relations_file, RELATION_FIELDS)
+        relation_members_writer = BlockWriter(relation_members_file,
+                                              RELATION_MEMBERS_FIELDS)
+        relation_tags_writer = BlockWriter(relation_tags_file, RELATION_TAGS_FIELDS)
+
+        validator = FastValidator()
+
+        for element in get_range_element(file_in, start, end):
+            el = shape_element(element, compact_way_nodes=True)
+            if el:
+                if validate is True:
+                    validate_element(el, validator)
+
+                if element.tag == 'node':
+                    nodes_writer.writerow(el['node'])
+                    nodes_tags_writer.writerows(el['node_tags'])
+                elif element.tag == 'way':
+                    ways_writer.writerow(el['way'])
+                    way_nodes_writer.writeints(el['way_nodes'].rows())
+                    way_tags_writer.writerows(el['way_tags'])
+                elif element.tag == 'relation':
+                    relations_writer.writerow(el['relation'])
+                    relation_members_writer.writetuples(el['relation_members'].rows())
+                    relation_tags_writer.writerows(el['relation_tags'])
+
+        nodes_writer.flush()
+        nodes_tags_writer.flush()
+        ways_writer.flush()
+        way_nodes_writer.flush()
+        way_tags_writer.flush()
+        relations_writer.flush()
+        relation_members_writer.flush()
+        relation_tags_writer.flush()
+
+    return index
+
+
+def merge_parts(tmp_dir, num_parts):
+    """ Writes the header of each CSV file, followed by the parts of every
+        range in file order, so the output matches a single-process run.
+    """
+    for path, fields in OUTPUTS:
+        with codecs.open(path, 'w') as out_file:
+            header_writer = BlockWriter(out_file, fields)
+            header_writer.writeheader()
+            header_writer.flush()
+            for index in range(num_parts):
+                with open(part_path(tmp_dir, index, path), 'rb') as part_file:
+                    shutil.copyfileobj(part_file, out_file, 1 << 20)
+
+
+def parallel_process_map(file_in, validate, processes=None):
+    """ Parallel version of process_map. Splits the OSM file into byte ranges
+        on element boundaries, shapes each range in a process pool, and merges
+        the results into the same CSV files, in the same order.
+
+        A compressed (.bz2 or .gz) file can't be split into byte ranges, so it
+        is converted by process_map in a single process, streaming the
+        decompressed XML.
+    """
+    if is_compressed(file_in):
+        process_map(file_in, validate)
+        return
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    ranges = split_ranges(file_in, processes * RANGES_PER_PROCESS)
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(NODES_PATH)))
+    pool = multiprocessing.Pool(processes)
+    try:
+        jobs = [(file_in, start, end, index, tmp_dir, validate)
+                for index, (start, end) in enumerate(ranges)]
+        for _ in pool.imap_unordered(process_range, jobs):
+            pass
+        pool.close()
+        pool.join()
+        merge_parts(tmp_dir, len(jobs))
+    finally:
+        pool.terminate()
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,137 @@
+import os
+
+from sql_schema import SHAPED_TABLES, TABLES, table_columns
+from sqlite_loader import table_rows
+
+ROW_GROUP_SIZE = 100000
+""" Rows buffered per table before they are written out as one Parquet row
+    group. Readers can skip whole row groups, and memory stays bounded while
+    streaming.
+"""
+
+COMPRESSION = 'snappy'
+
+DICTIONARY_COLUMNS = frozenset(['user', 'key', 'type', 'member_type', 'role'])
+""" Columns with few distinct values, stored as dictionary arrays (a small
+    table of distinct strings plus an integer index per row)
+"""
+
+
+def parquet_path(out_dir, table_name):
+    return os.path.join(out_dir, table_name + '.parquet')
+
+
+def to_integer(value):
+    return int(value) if value is not None and value != '' else None
+
+
+def to_real(value):
+    return float(value) if value is not None and value != '' else None
+
+
+def to_text(value):
+    return value.decode('utf-8') if isinstance(value, str) else value
+
+
+COLUMN_CONVERTERS = {'INTEGER': to_integer, 'REAL': to_real, 'TEXT': to_text}
+""" Converts a value of a shaped element to its column's type. Unlike
+    sql_schema.CONVERTERS, the values are Python values, not CSV text.
+"""
+
+
+def table_schema(pa, table_name):
+    """ Returns the Arrow schema of a table, from its SQLite column types """
+    arrow_types = {'INTEGER': pa.int64(), 'REAL': pa.float64(), 'TEXT': pa.string()}
+    fields = []
+    for column, column_type in dict(TABLES)[table_name]:
+        arrow_type = arrow_types[column_type.split()[0]]
+        if column in DICTIONARY_COLUMNS:
+            arrow_type = pa.dictionary(pa.int32(), arrow_type)
+        fields.append(pa.field(column, arrow_type,
+                               nullable='NOT NULL' not in column_type))
+    return pa.schema(fields)
+
+
+class ParquetSink(object):
+    """ Writes shaped elements to one Parquet file per table (nodes.parquet,
+        nodes_tags.parquet, ...) in 'out_dir'. Columns are typed as in the
+        SQLite tables, the DICTIONARY_COLUMNS are dictionary encoded, and
+        each file is compressed and written in row groups of
+        'row_group_size' rows as elements arrive.
+
+        The files can be memory-mapped and read a few columns at a time, for
+        example pyarrow.parquet.read_table(path, columns=['key', 'value'],
+        memory_map=True).
+
+        Needs pyarrow. Call close() when done, which writes the last row
+        groups and the file footers.
+    """
+
+    def __init__(self, out_dir='.', row_group_size=ROW_GROUP_SIZE,
+                 compression=COMPRESSION):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet output needs pyarrow (pip install pyarrow)")
+        self.pa = pyarrow
+        self.row_group_size = row_group_size
+        self.columns = {}
+        self.converters = {}
+        self.schemas = {}
+        self.writers = {}
+        self.rows = {}
+        self.counts = {}
+        for table_name in SHAPED_TABLES.values():
+            self.columns[table_name] = table_columns(table_name)
+            self.converters[table_name] = [COLUMN_CONVERTERS[column_type.split()[0]]
+                                           for _, column_type in dict(TABLES)[table_name]]
+            self.schemas[table_name] = table_schema(pyarrow, table_name)
+            self.writers[table_name] = pyarrow.parquet.ParquetWriter(
+                parquet_path(out_dir, table_name), self.schemas[table_name],
+                compression=compression,
+                use_dictionary=[column for column in self.columns[table_name]
+                                if column in DICTIONARY_COLUMNS])
+            self.rows[table_name] = []
+            self.counts[table_name] = 0
+
+    def add(self, el):
+        """ Adds the rows of one shaped element, writing a row group for each
+            table that has filled one
+        """
+        for key, value in el.iteritems():
+            table_name = SHAPED_TABLES[key]
+            rows = self.rows[table_name]
+            rows.extend(table_rows(value, self.columns[table_name]))
+            if len(rows) >= self.row_group_size:
+                self.flush(table_name)
+
+    def flush(self, table_name):
+        """ Writes the buffered rows of a table as one row group """
+        rows = self.rows[table_name]
+        if not rows:
+            return
+        pa = self.pa
+        schema = self.schemas[table_name]
+        arrays = []
+        for field, convert, values in zip(schema, self.converters[table_name],
+                                          zip(*rows)):
+            values = [convert(value) for value in values]
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(values, type=field.type.value_type)
+                              .dictionary_encode())
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        self.writers[table_name].write_table(
+            pa.Table.from_arrays(arrays, schema=schema))
+        self.counts[table_name] += len(rows)
+        self.rows[table_name] = []
+
+    def close(self):
+        """ Writes the remaining rows and closes every file. Returns the rows
+            written per table.
+        """
+        for table_name, writer in self.writers.items():
+            self.flush(table_name)
+            writer.close()
+        return dict(self.counts)
@@ -0,0 +1,328 @@
+import csv
+import codecs
+import re
+
+import cerberus
+
+import schema
+from block_writer import BlockWriter
+from cleaning_rules import load_rules
+from key_classifier import KeyClassifier
+from node_locations import WAY_GEOMETRY_FIELDS, node_locations, way_geometry_row
+from osm_reader import DEFAULT_PARSER, get_element
+from schema_compiler import FastValidator
+from summary_stats import SummaryStats
+from relation_members import RelationMembers
+from way_node_arrays import WayNodes
+
+CLEANING_RULES = load_rules()
+""" The tag cleaning rules of cleaning_rules.json, see cleaning_rules.py """
+
+mapping = CLEANING_RULES.cleaner_options('street_type')['mapping']
+""" Dictionary that maps incorrect street types to correct street types """
+
+
+VANCOUVER_CITY_OSM = "/Users/nehaludyavar/Downloads/Vancouver_City_v2.osm"
+VANCOUVER_CITY_SAMPLE = "/Users/nehaludyavar/Downloads/Vancouver_City_Sample.osm"
+
+NODES_PATH = "nodes.csv"
+NODES_TAG_PATH = "nodes_tags.csv"
+WAYS_PATH = "ways.csv"
+WAY_NODES_PATH = "way_nodes.csv"
+WAY_TAGS_PATH = "ways_tags.csv"
+RELATIONS_PATH = "relations.csv"
+RELATION_MEMBERS_PATH = "relation_members.csv"
+RELATION_TAGS_PATH = "relation_tags.csv"
+WAYS_GEOMETRY_PATH = "ways_geometry.csv"
+
+LOWER_COLON = re.compile(r'^([a-z]|_)+:([a-z]|_)+')
+""" Regex to choose string from left side of colon """
+PROBLEMCHARS = re.compile(r'[=\+/&<>;\'"\?%#$@\,\. \t\r\n]')
+""" Regex for problem characters """
+
+KEY_CLASSIFIER = KeyClassifier(PROBLEMCHARS)
+classify_key = KEY_CLASSIFIER.classify
+""" Splits each distinct tag key into its key and type (and checks it for
+    problem characters) only once, see key_classifier.py
+"""
+
+SCHEMA = schema.schema
+""" Imports the schema from the schema.py file """
+
+NODE_FIELDS = ['id', 'lat', 'lon', 'user', 'uid', 'version', 'changeset', 'timestamp']
+NODE_TAG_FIELDS = ['id', 'key', 'value', 'type']
+WAY_FIELDS = ['id', 'user', 'uid', 'version', 'changeset', 'timestamp']
+WAY_TAGS_FIELDS = ['id', 'key', 'value', 'type']
+WAY_NODES_FIELDS = ['id', 'node_id', 'position']
+RELATION_FIELDS = ['id', 'user', 'uid', 'version', 'changeset', 'timestamp']
+RELATION_MEMBERS_FIELDS = ['id', 'member_type', 'member_id', 'role', 'position']
+RELATION_TAGS_FIELDS = ['id', 'key', 'value', 'type']
+""" List of headers that will be on the CSV file, which is also the table
+    parameters for the SQLite database that it will be imported into later.
+"""
+
+def shape_element(element, node_attr_fields=NODE_FIELDS, way_attr_fields=WAY_FIELDS,
+                  problem_chars=PROBLEMCHARS, default_tag_type='regular',
+                  compact_way_nodes=False):
+    """ Iteratively parses through each element tag for some OSM XML file and
+        adds the data from the tag into the dictionary provided in the schema.py
+        file. Along the way, the street types are updated to clean out incorrect
+        street types, and the postal codes are updated to make sure all postal
+        codes are consistent in their representation. This is what's used to
+        organize the XML data so that it can be imported into CSV files
+
+        Returns:
+            A dictionary with nodes and nodes_tags dictionaries, which include
+            nodes attributes dictionary and tags list respectively.
+            Another dictionary with ways, way_nodes and way_tags keys, with ways
+            having a way attributes dictionary and way_nodes and way_tags
+            including way_nodes and tags list respectively. Relations are
+            shaped like ways, into relation, relation_members and
+            relation_tags. With 'compact_way_nodes', way_nodes is a WayNodes
+            object of integer arrays instead (see way_node_arrays.py), and
+            relation_members a RelationMembers object (see
+            relation_members.py).
+    """
+    node_attribs = {}
+    way_attribs = {}
+    way_nodes = []
+    tags = []
+
+    if element.tag == 'node':
+        cleaners = CLEANING_RULES.dispatch['node']
+        for item in NODE_FIELDS:
+            node_attribs[item] = element.get(item)
+        for child in element:
+            if child.tag == 'tag':
+                key = child.attrib['k']
+                clean = cleaners.get(key)
+                if clean is not None:
+                    child.attrib['v'] = clean(child.get('v'))  # Street names, postcodes, ...
+                tag_key, tag_type, is_problem = classify_key(key)
+                node_tag = {'id': element.attrib['id'],
+                            'value': child.attrib['v'],
+                            'type': tag_type}
+                if not is_problem:
+                    node_tag['key'] = tag_key
+                tags.append(node_tag)
+        return {'node': node_attribs, 'node_tags': tags}
+    elif element.tag == 'way':
+        cleaners = CLEANING_RULES.dispatch['way']
+        for item in WAY_FIELDS:
+            way_attribs[item] = element.attrib[item]
+        if compact_way_nodes:
+            way_nodes = WayNodes(element.attrib['id'])
+        for index, child in enumerate(element):
+            if child.tag == 'nd' and compact_way_nodes:
+                way_nodes.append(child.attrib['ref'], index)
+            elif child.tag == 'nd':
+                way_node = {}
+                for item in WAY_NODES_FIELDS:
+                    if item == 'id':
+                        way_node[item] = element.attrib['id']
+                    elif item == 'node_id':
+                        way_node[item] = child.attrib['ref']
+                    elif item == 'position':
+                        way_node[item] = index
+                way_nodes.append(way_node)
+            if child.tag == 'tag':
+                key = child.attrib['k']
+                clean = cleaners.get(key)
+                if clean is not None:
+                    child.attrib['v'] = clean(child.get('v'))
+                tag_key, tag_type, is_problem = classify_key(key)
+                way_tag = {'id': element.attrib['id'],
+                           'value': child.attrib['v'],
+                           'type': tag_type}
+                if not is_problem:
+                    way_tag['key'] = tag_key
+                tags.append(way_tag)
+        return {'way': way_attribs, 'way_nodes': way_nodes, 'way_tags': tags}
+    elif element.tag == 'relation':
+        cleaners = CLEANING_RULES.dispatch['relation']
+        relation_attribs = {}
+        for item in RELATION_FIELDS:
+            relation_attribs[item] = element.attrib[item]
+        members = RelationMembers(element.attrib['id']) if compact_way_nodes else []
+        for index, child in enumerate(element):
+            if child.tag == 'member' and compact_way_nodes:
+                members.append(child.attrib['type'], child.attrib['ref'],
+                               child.attrib['role'], index)
+            elif child.tag == 'member':
+                members.append({'id': element.attrib['id'],
+                                'member_type': child.attrib['type'],
+                                'member_id': child.attrib['ref'],
+                                'role': child.attrib['role'],
+                                'position': index})
+            elif child.tag == 'tag':
+                key = child.attrib['k']
+                clean = cleaners.get(key)
+                if clean is not None:
+                    child.attrib['v'] = clean(child.get('v'))
+                tag_key, tag_type, is_problem = classify_key(key)
+                relation_tag = {'id': element.attrib['id'],
+                                'value': child.attrib['v'],
+                                'type': tag_type}
+                if not is_problem:
+                    relation_tag['key'] = tag_key
+                tags.append(relation_tag)
+        return {'relation': relation_attribs, 'relation_members': members,
+                'relation_tags': tags}
+
+
+# ================================ #
+#           Helper Functions       #
+# ================================ #
+
+def persist_normalization_caches(cache_dir):
+    """ Loads the cleaning rules' normalization caches from 'cache_dir', and
+        makes process_map save them there when it's done.
+    """
+    CLEANING_RULES.persist(cache_dir)
+
+
+def validate_element(element, validator, schema=SCHEMA):
+    """Raise ValidationError if element does not match schema"""
+
+    if not isinstance(validator, FastValidator):
+        # FastValidator accepts the compact lists as they are, see
+        # schema_compiler.COMPACT_LISTS
+        if isinstance(element.get('way_nodes'), WayNodes):
+            element = dict(element, way_nodes=[])
+        elif isinstance(element.get('relation_members'), RelationMembers):
+            element = dict(element, relation_members=list(element['relation_members']))
+    if validator.validate(element, schema) is not True:
+        field, errors = next(validator.errors.iteritems())
+        message_string = "\nElement of type '{0}' has the following errors:\n{1}"
+        error_strings = (
+            "{0}: {1}".format(k, v if isinstance(v, str) else ", ".join(v))
+            for k, v in errors.iteritems()
+        )
+        raise cerberus.ValidationError(
+            message_string.format(field, "\n".join(error_strings))
+        )
+
+
+class UnicodeDictWriter(csv.DictWriter, object):
+    """Extend csv.DictWriter to handle Unicode input"""
+
+    def writerow(self, row):
+        super(UnicodeDictWriter, self).writerow({
+            k: (v.encode('utf-8') if isinstance(v, unicode) else v) for k, v in row.iteritems()
+        })
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+
+
+# ================================ #
+#           Main Function          #
+# ================================ #
+
+def process_map(file_in, validate, summary_path=None, parser=DEFAULT_PARSER,
+                geometry=False, locations='sparse', parquet_dir=None):
+    """Iteratively process each XML element and write to csv(s). If
+    'summary_path' is given, the overview statistics are written there as
+    JSON (see summary_stats.py). 'parser' is the XML parser backend (see
+    osm_reader.PARSERS). With 'geometry', node coordinates are kept in a
+    node location store of the given kind as the nodes stream past, and the
+    length and bounding box of each way are written to ways_geometry.csv
+    (see node_locations.py). With 'parquet_dir', every table is also
+    written there as a Parquet file (see parquet_sink.py, needs pyarrow)."""
+
+    with codecs.open(NODES_PATH, 'w') as nodes_file, \
+         codecs.open(NODES_TAG_PATH, 'w') as nodes_tags_file, \
+         codecs.open(WAYS_PATH, 'w') as ways_file, \
+         codecs.open(WAY_NODES_PATH, 'w') as way_nodes_file, \
+         codecs.open(WAY_TAGS_PATH, 'w') as way_tags_file, \
+         codecs.open(RELATIONS_PATH, 'w') as relations_file, \
+         codecs.open(RELATION_MEMBERS_PATH, 'w') as relation_members_file, \
+         codecs.open(RELATION_TAGS_PATH, 'w') as relation_tags_file:
+
+        nodes_writer = BlockWriter(nodes_file, NODE_FIELDS)
+        nodes_tags_writer = BlockWriter(nodes_tags_file, NODE_TAG_FIELDS)
+        ways_writer = BlockWriter(ways_file, WAY_FIELDS)
+        way_nodes_writer = BlockWriter(way_nodes_file, WAY_NODES_FIELDS)
+        way_tags_writer = BlockWriter(way_tags_file, WAY_TAGS_FIELDS)
+        relations_writer = BlockWriter(relations_file, RELATION_FIELDS)
+        relation_members_writer = BlockWriter(relation_members_file,
+                                              RELATION_MEMBERS_FIELDS)
+        relation_tags_writer = BlockWriter(relation_tags_file, RELATION_TAGS_FIELDS)
+
+        nodes_writer.writeheader()
+        nodes_tags_writer.writeheader()
+        ways_writer.writeheader()
+        way_nodes_writer.writeheader()
+        way_tags_writer.writeheader()
+        relations_writer.writeheader()
+        relation_members_writer.writeheader()
+        relation_tags_writer.writeheader()
+
+        validator = FastValidator()
+        summary = SummaryStats() if summary_path is not None else None
+        geometry_file = None
+        node_store = None
+        parquet = None
+        if geometry:
+            geometry_file = codecs.open(WAYS_GEOMETRY_PATH, 'w')
+        try:
+            if geometry:
+                geometry_writer = BlockWriter(geometry_file, WAY_GEOMETRY_FIELDS)
+                geometry_writer.writeheader()
+                node_store = node_locations(locations)
+            if parquet_dir is not None:
+                from parquet_sink import ParquetSink    # It imports this module
+                parquet = ParquetSink(parquet_dir)
+
+            for element in get_element(file_in, parser=parser):
+                el = shape_element(element, compact_way_nodes=True)
+                if el:
+                    if validate is True:
+                        validate_element(el, validator)
+                    if summary is not None:
+                        summary.add(el)
+                    if parquet is not None:
+                        parquet.add(el)
+
+                    if element.tag == 'node':
+                        nodes_writer.writerow(el['node'])
+                        nodes_tags_writer.writerows(el['node_tags'])
+                        if geometry:
+                            node = el['node']
+                            node_store.set(int(node['id']), node['lat'], node['lon'])
+                    elif element.tag == 'way':
+                        ways_writer.writerow(el['way'])
+                        way_nodes_writer.writeints(el['way_nodes'].rows())
+                        way_tags_writer.writerows(el['way_tags'])
+                        if geometry:
+                            way_nodes = el['way_nodes']
+                            geometry_writer.writevalues(way_geometry_row(
+                                way_nodes.way_id, way_nodes.node_ids, node_store))
+                    elif element.tag == 'relation':
+                        relations_writer.writerow(el['relation'])
+                        relation_members_writer.writetuples(el['relation_members'].rows())
+                        relation_tags_writer.writerows(el['relation_tags'])
+
+            if geometry:
+                geometry_writer.flush()
+        finally:
+            if node_store is not None:
+                node_store.close()
+            if geometry_file is not None:
+                geometry_file.close()
+            if parquet is not None:
+                parquet.close()
+        nodes_writer.flush()
+        nodes_tags_writer.flush()
+        ways_writer.flush()
+        way_nodes_writer.flush()
+        way_tags_writer.flush()
+        relations_writer.flush()
+        relation_members_writer.flush()
+        relation_tags_writer.flush()
+
+    CLEANING_RULES.save()
+    if summary is not None:
+        summary.write_json(summary_path)
@@ -0,0 +1,137 @@
+from array import array
+from itertools import repeat
+import pprint
+import sys
+import time
+
+from way_node_arrays import TYPECODE
+
+MEMBER_TYPES = ('node', 'way', 'relation')
+MEMBER_CODES = dict((member_type, code) for code, member_type in enumerate(MEMBER_TYPES))
+""" Member types are stored as their index in MEMBER_TYPES """
+
+FIELDS = ('id', 'member_type', 'member_id', 'role', 'position')
+""" The order of the values in each row, the same as RELATION_MEMBERS_FIELDS """
+
+ROLES = {}
+""" One shared string per distinct role ('outer', 'inner', 'stop', ...), so
+    that members don't each keep their own copy
+"""
+
+
+class RelationMembers(object):
+    """ Compact form of a relation's 'relation_members' list, the counterpart
+        of WayNodes (see way_node_arrays.py). It keeps the relation id, the
+        member types as one byte each, integer arrays of member ids and
+        positions, and a list of shared role strings.
+
+        Iterating over it gives the dictionaries shape_element builds
+        otherwise (with integer ids), and rows() gives the row tuples.
+    """
+
+    __slots__ = ('relation_id', 'types', 'member_ids', 'roles', 'positions')
+
+    def __init__(self, relation_id):
+        self.relation_id = int(relation_id)
+        self.types = array('b')
+        self.member_ids = array(TYPECODE)
+        self.roles = []
+        self.positions = array(TYPECODE)
+
+    def append(self, member_type, member_id, role, position):
+        self.types.append(MEMBER_CODES[member_type])
+        self.member_ids.append(int(member_id))
+        self.roles.append(ROLES.setdefault(role, role))
+        self.positions.append(position)
+
+    def __len__(self):
+        return len(self.member_ids)
+
+    def __iter__(self):
+        for row in self.rows():
+            yield dict(zip(FIELDS, row))
+
+    def rows(self):
+        """ Returns the (id, member_type, member_id, role, position) tuple of
+            each member
+        """
+        return zip(repeat(self.relation_id, len(self.member_ids)),
+                   [MEMBER_TYPES[code] for code in self.types],
+                   self.member_ids, self.roles, self.positions)
+
+
+# ================================ #
+#           Queries                #
+# ================================ #
+
+def relation_ways(conn, relation_id):
+    """ Returns the (way id, role) of each way in a relation, in member order """
+    return conn.execute("SELECT member_id, role FROM relation_members "
+                        "WHERE id = ? AND member_type = 'way' ORDER BY position",
+                        (relation_id,)).fetchall()
+
+
+def relation_nodes(conn, relation_id):
+    """ Returns the (node id, lat, lon, role) of each node of a relation:
+        its node members, then the nodes of its way members, in order.
+        Member relations aren't followed.
+    """
+    nodes = conn.execute(
+        "SELECT n.id, n.lat, n.lon, m.role FROM relation_members m "
+        "JOIN nodes n ON n.id = m.member_id "
+        "WHERE m.id = ? AND m.member_type = 'node' ORDER BY m.position",
+        (relation_id,)).fetchall()
+    nodes.extend(conn.execute(
+        "SELECT n.id, n.lat, n.lon, m.role FROM relation_members m "
+        "JOIN ways_nodes w ON w.id = m.member_id "
+        "JOIN nodes n ON n.id = w.node_id "
+        "WHERE m.id = ? AND m.member_type = 'way' ORDER BY m.position, w.position",
+        (relation_id,)))
+    return nodes
+
+
+def member_relations(conn, member_type, member_id):
+    """ Returns the (relation id, role) of every relation an element is a
+        member of
+    """
+    return conn.execute("SELECT id, role FROM relation_members "
+                        "WHERE member_type = ? AND member_id = ?",
+                        (member_type, member_id)).fetchall()
+
+
+# ================================ #
+#           Benchmark              #
+# ================================ #
+
+def benchmark(osm_file):
+    """ Times shaping every relation in the file with and without compact
+        members, and compares the memory used by the members.
+    """
+    from osm_reader import get_element
+    from preparing_for_database import shape_element
+
+    def dict_size(rows):
+        return sum(sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values())
+                   for row in rows) + sys.getsizeof(rows)
+
+    def array_size(members):
+        # Role strings are shared, so only the list holding them counts
+        return (sys.getsizeof(members) + sys.getsizeof(members.types) +
+                sys.getsizeof(members.member_ids) + sys.getsizeof(members.roles) +
+                sys.getsizeof(members.positions))
+
+    results = {}
+    for compact, size in ((False, dict_size), (True, array_size)):
+        start = time.time()
+        total = 0
+        members = 0
+        for element in get_element(osm_file, tags=('relation',)):
+            shaped = shape_element(element, compact_way_nodes=compact)['relation_members']
+            total += size(shaped)
+            members += len(shaped)
+        results['compact' if compact else 'dicts'] = {
+            'seconds': time.time() - start,
+            'bytes_per_member': float(total) / members if members else 0.0
+        }
+    pprint.pprint(results)
+    return results
@@ -0,0 +1,227 @@
+import json
+import os
+import pprint
+import shutil
+import tempfile
+import time
+
+from block_writer import BlockWriter
+from osm_reader import find_root_end, get_element, get_range_element, \
+    is_compressed, split_ranges
+from parallel_processing import OUTPUTS
+from preparing_for_database import shape_element, validate_element, \
+    CLEANING_RULES
+from schema_compiler import FastValidator
+
+CHECKPOINT_PATH = "process_map.checkpoint"
+
+SEGMENT_SIZE = 32 << 20
+""" Bytes of OSM input converted between checkpoints. A crash loses at most
+    the work done on one segment.
+"""
+
+
+def input_fingerprint(file_in):
+    """ Identifies the input file, so that a checkpoint is never resumed on a
+        different (or changed) file
+    """
+    stat = os.stat(file_in)
+    return {'path': os.path.abspath(file_in), 'size': stat.st_size,
+            'mtime': stat.st_mtime}
+
+
+def load_checkpoint(checkpoint_path, file_in):
+    """ Returns the saved checkpoint, or None if there isn't one. Raises
+        ValueError if it was saved for another input file.
+    """
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    if checkpoint['input'] != input_fingerprint(file_in):
+        raise ValueError("Checkpoint %s is for %s, not %s"
+                         % (checkpoint_path, checkpoint['input']['path'], file_in))
+    return checkpoint
+
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    """ Writes the checkpoint to a temporary file and renames it over the old
+        one, so a crash while saving leaves the previous checkpoint intact
+    """
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp_path, checkpoint_path)
+
+
+def open_outputs(checkpoint):
+    """ Opens the CSV files for writing. Without a checkpoint they are
+        created with their headers; otherwise they are cut back to the sizes
+        recorded in the checkpoint (dropping rows written after it) and opened
+        for appending.
+    """
+    files = []
+    for path, fields in OUTPUTS:
+        if checkpoint is None:
+            f = open(path, 'wb')
+            header_writer = BlockWriter(f, fields)
+            header_writer.writeheader()
+            header_writer.flush()
+        else:
+            with open(path, 'r+b') as f:
+                f.truncate(checkpoint['outputs'][path])
+            f = open(path, 'ab')
+        files.append(f)
+    return files
+
+
+def resumable_process_map(file_in, validate, checkpoint_path=CHECKPOINT_PATH,
+                          segment_size=SEGMENT_SIZE):
+    """ Version of process_map that can be resumed after a crash. The input is
+        converted in segments of about 'segment_size' bytes, each starting on
+        an element boundary. After each segment the CSV files are flushed to
+        disk and a checkpoint records the input byte offset reached and the
+        size of each CSV file.
+
+        If the checkpoint exists when this is called, the conversion carries
+        on from exactly the input offset it recorded (the start of the first
+        element not yet converted), so no rows are duplicated or lost, even
+        if 'segment_size' is not the same as before. The checkpoint is
+        removed once the whole file is converted.
+
+        A compressed (.bz2 or .gz) file is converted in a single segment,
+        streaming the decompressed XML, and can't be resumed: its byte
+        offsets don't map to offsets in the XML, so no checkpoint is saved.
+
+        Returns:
+            dictionary: segments and elements converted by this call, and
+            whether it resumed from a checkpoint.
+    """
+    if is_compressed(file_in):
+        checkpoint = None
+        segments_in = [(None, get_element(file_in))]
+    else:
+        checkpoint = load_checkpoint(checkpoint_path, file_in)
+        input_offset = checkpoint['input_offset'] if checkpoint else 0
+        num_segments = max(1, (find_root_end(file_in) - input_offset) // segment_size)
+        segments_in = [(end, get_range_element(file_in, start, end)) for start, end
+                       in split_ranges(file_in, num_segments, input_offset)]
+
+    start_time = time.time()
+    files = open_outputs(checkpoint)
+    try:
+        writers = [BlockWriter(f, fields) for f, (_, fields) in zip(files, OUTPUTS)]
+        nodes_writer, nodes_tags_writer, ways_writer, way_nodes_writer, \
+            way_tags_writer, relations_writer, relation_members_writer, \
+            relation_tags_writer = writers
+        validator = FastValidator()
+        segments = 0
+        elements = 0
+
+        for end, segment in segments_in:
+            for element in segment:
+                el = shape_element(element, compact_way_nodes=True)
+                if el:
+                    if validate is True:
+                        validate_element(el, validator)
+
+                    if element.tag == 'node':
+                        nodes_writer.writerow(el['node'])
+                        nodes_tags_writer.writerows(el['node_tags'])
+                    elif element.tag == 'way':
+                        ways_writer.writerow(el['way'])
+                        way_nodes_writer.writeints(el['way_nodes'].rows())
+                        way_tags_writer.writerows(el['way_tags'])
+                    elif element.tag == 'relation':
+                        relations_writer.writerow(el['relation'])
+                        relation_members_writer.writetuples(el['relation_members'].rows())
+                        relation_tags_writer.writerows(el['relation_tags'])
+                    elements += 1
+
+            for writer, f in zip(writers, files):
+                writer.flush()
+                f.flush()
+                os.fsync(f.fileno())
+            if end is not None:
+                save_checkpoint(checkpoint_path, {
+                    'input': input_fingerprint(file_in),
+                    'input_offset': end,
+                    'outputs': dict((path, f.tell())
+                                    for f, (path, _) in zip(files, OUTPUTS))
+                })
+            segments += 1
+    finally:
+        for f in files:
+            f.close()
+
+    CLEANING_RULES.save()
+    if not is_compressed(file_in) and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    report = {
+        'resumed': checkpoint is not None,
+        'segments': segments,
+        'elements': elements,
+        'seconds': time.time() - start_time
+    }
+    pprint.pprint(report)
+    return report
+
+
+# ================================ #
+#           Test                   #
+# ================================ #
+
+def test(osm_file, crash_after=2, segments=7, resumed_segments=3):
+    """ Converts the file in one go, and again with a crash simulated after
+        'crash_after' of 'segments' segments (once some rows of the next
+        segment have been written), resumed with a different segment size.
+        Checks that both give the same CSV files.
+    """
+    global save_checkpoint
+
+    osm_file = os.path.abspath(osm_file)
+    size = os.path.getsize(osm_file)
+    tmp_dir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    save = save_checkpoint
+
+    def crashing_save(checkpoint_path, checkpoint):
+        if saved[0] == crash_after:
+            raise RuntimeError("Simulated crash")
+        saved[0] += 1
+        save(checkpoint_path, checkpoint)
+
+    try:
+        for name in ('clean', 'resumed'):
+            os.mkdir(os.path.join(tmp_dir, name))
+        os.chdir(os.path.join(tmp_dir, 'clean'))
+        resumable_process_map(osm_file, validate=False)
+
+        os.chdir(os.path.join(tmp_dir, 'resumed'))
+        saved = [0]
+        save_checkpoint = crashing_save
+        try:
+            resumable_process_map(osm_file, validate=False,
+                                  segment_size=size // segments)
+            raise AssertionError("The simulated crash didn't happen")
+        except RuntimeError:
+            pass
+        finally:
+            save_checkpoint = save
+        assert os.path.exists(CHECKPOINT_PATH)
+        report = resumable_process_map(osm_file, validate=False,
+                                       segment_size=size // resumed_segments)
+        assert report['resumed']
+
+        for path, _ in OUTPUTS:
+            with open(os.path.join(tmp_dir, 'clean', path), 'rb') as f:
+                expected = f.read()
+            with open(os.path.join(tmp_dir, 'resumed', path), 'rb') as f:
+                assert f.read() == expected, "%s differs after resuming" % path
+    finally:
+        save_checkpoint = save
+        os.chdir(cwd)
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,135 @@
+from collections import defaultdict
+import pprint
+
+from auditing_street_names import audit_street_type, is_street_name
+from auditing_postal_codes import audit_postal_code, is_postal_code
+from osm_reader import get_element
+
+
+class AuditVisitor(object):
+    """ Base class for a single audit over the OSM file. The audit engine calls
+        'begin' once with the root element, 'visit' for every top-level element
+        (node, way, relation, bounds, ...) once it has been fully parsed, and
+        'result' when the parse is complete.
+    """
+
+    def begin(self, root):
+        pass
+
+    def visit(self, element):
+        pass
+
+    def result(self):
+        return None
+
+
+class TagCountVisitor(AuditVisitor):
+    """ Counts every element tag in the file (same output as 'count_tags') """
+
+    def __init__(self):
+        self.tags = defaultdict(int)
+
+    def begin(self, root):
+        self.tags[root.tag] += 1
+
+    def visit(self, element):
+        for elem in element.iter():
+            self.tags[elem.tag] += 1
+
+    def result(self):
+        return dict(self.tags)
+
+
+class UserVisitor(AuditVisitor):
+    """ Collects the set of users of all node, way and relation elements """
+
+    def __init__(self):
+        self.users = set()
+
+    def visit(self, element):
+        if element.tag in ('node', 'way', 'relation'):
+            self.users.add(element.get('user'))
+
+    def result(self):
+        return self.users
+
+
+class StreetTypeVisitor(AuditVisitor):
+    """ Runs 'audit_street_type' on the street name tags of nodes and ways """
+
+    def __init__(self):
+        self.street_types = defaultdict(set)
+
+    def visit(self, element):
+        if element.tag == 'node' or element.tag == 'way':
+            for tag in element.iter('tag'):
+                if is_street_name(tag):
+                    audit_street_type(self.street_types, tag.attrib['v'])
+
+    def result(self):
+        return self.street_types
+
+
+class PostalCodeVisitor(AuditVisitor):
+    """ Runs 'audit_postal_code' on the postcode tags of nodes and ways, and
+        returns the list of incorrect postcodes.
+    """
+
+    def __init__(self):
+        self.correct_PCs = []
+        self.incorrect_PCs = []
+
+    def visit(self, element):
+        if element.tag == 'node' or element.tag == 'way':
+            for tag in element.iter('tag'):
+                if is_postal_code(tag):
+                    audit_postal_code(self.correct_PCs, self.incorrect_PCs,
+                                      tag.attrib['v'])
+
+    def result(self):
+        return self.incorrect_PCs
+
+
+def default_visitors():
+    """ Returns a dictionary of the standard audits, keyed by report name """
+    return {
+        'tags': TagCountVisitor(),
+        'users': UserVisitor(),
+        'street_types': StreetTypeVisitor(),
+        'postal_codes': PostalCodeVisitor()
+    }
+
+
+def audit(osmfile, visitors=None):
+    """ Parses the OSM file once and runs every visitor over it. Each top-level
+        element is handed to the visitors once it has been fully parsed (so all
+        of its child tags are available), using the streaming 'get_element'
+        reader so that memory doesn't grow with the size of the file.
+
+        Returns:
+            dictionary: report name:visitor result pairs.
+    """
+    if visitors is None:
+        visitors = default_visitors()
+
+    elements = get_element(osmfile, tags=None, with_root=True)
+    root = next(elements)
+    for visitor in visitors.values():
+        visitor.begin(root)
+
+    for element in elements:
+        for visitor in visitors.values():
+            visitor.visit(element)
+
+    return dict((name, visitor.result()) for name, visitor in visitors.items())
+
+
+def print_audit(osmfile):
+    """ Prints the full audit report from a single parse of the file """
+    report = audit(osmfile)
+    pprint.pprint(report['tags'])
+    pprint.pprint(len(report['users']))
+    pprint.pprint(dict(report['street_types']))
+    pprint.pprint(len(report['street_types']))
+    pprint.pprint(report['postal_codes'])
+    pprint.pprint(len(report['postal_codes']))
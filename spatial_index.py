@@ -0,0 +1,232 @@
+import math
+import pprint
+import sqlite3
+
+RTREE_TABLE = "nodes_rtree"
+GRID_TABLE = "nodes_grid"
+
+GRID_SIZE = 0.01
+""" Size of a grid cell in degrees (about 1.1 km of latitude), for SQLite
+    builds without the rtree module
+"""
+GRID_COLUMNS = int(round(360 / GRID_SIZE))
+
+EARTH_RADIUS = 6371008.8
+""" Mean radius of the Earth in metres """
+
+INITIAL_RADIUS = 250.0
+MAX_RADIUS = 50000.0
+""" The nearest-neighbour search looks within INITIAL_RADIUS metres first,
+    and widens the search up to MAX_RADIUS until it has found enough nodes.
+"""
+
+
+def spatial_index_kind(conn):
+    """ Returns 'rtree' or 'grid' for the kind of spatial index the database
+        has, or None if it has none.
+    """
+    tables = set(name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'"))
+    if RTREE_TABLE in tables:
+        return 'rtree'
+    if GRID_TABLE in tables:
+        return 'grid'
+    return None
+
+
+def create_spatial_index(conn):
+    """ (Re)builds the spatial index of the nodes table. It is an R-tree
+        (nodes_rtree) if SQLite has the rtree module, or else a table of grid
+        cells (nodes_grid). Returns the kind of index built.
+    """
+    cur = conn.cursor()
+    cur.execute("DROP TABLE IF EXISTS %s" % RTREE_TABLE)
+    cur.execute("DROP TABLE IF EXISTS %s" % GRID_TABLE)
+    try:
+        cur.execute("CREATE VIRTUAL TABLE %s USING rtree(id, min_lat, max_lat, "
+                    "min_lon, max_lon)" % RTREE_TABLE)
+    except sqlite3.OperationalError:
+        cur.execute("CREATE TABLE %s (cell INTEGER NOT NULL, "
+                    "id INTEGER PRIMARY KEY NOT NULL)" % GRID_TABLE)
+        cur.execute("INSERT INTO %s SELECT %s, id FROM nodes WHERE lat IS NOT NULL "
+                    "AND lon IS NOT NULL" % (GRID_TABLE, grid_cell_sql('lat', 'lon')))
+        cur.execute("CREATE INDEX %s_cell ON %s (cell)" % (GRID_TABLE, GRID_TABLE))
+        return 'grid'
+    cur.execute("INSERT INTO %s SELECT id, lat, lat, lon, lon FROM nodes "
+                "WHERE lat IS NOT NULL AND lon IS NOT NULL" % RTREE_TABLE)
+    return 'rtree'
+
+
+def grid_row(lat):
+    return int(math.floor((lat + 90) / GRID_SIZE))
+
+
+def grid_column(lon):
+    return int(math.floor((lon + 180) / GRID_SIZE))
+
+
+def grid_cell_sql(lat, lon):
+    """ SQL expression for the grid cell of a latitude and longitude """
+    return ("CAST((%s + 90) / %r AS INTEGER) * %d + CAST((%s + 180) / %r AS INTEGER)"
+            % (lat, GRID_SIZE, GRID_COLUMNS, lon, GRID_SIZE))
+
+
+def index_node(conn, kind, node_id, lat, lon):
+    """ Adds or moves one node in the spatial index """
+    unindex_node(conn, kind, node_id)
+    if lat is None or lon is None:
+        return
+    lat, lon = float(lat), float(lon)
+    if kind == 'rtree':
+        conn.execute("INSERT INTO %s VALUES (?, ?, ?, ?, ?)" % RTREE_TABLE,
+                     (int(node_id), lat, lat, lon, lon))
+    elif kind == 'grid':
+        conn.execute("INSERT INTO %s VALUES (?, ?)" % GRID_TABLE,
+                     (grid_row(lat) * GRID_COLUMNS + grid_column(lon), int(node_id)))
+
+
+def unindex_node(conn, kind, node_id):
+    """ Removes one node from the spatial index """
+    if kind == 'rtree':
+        conn.execute("DELETE FROM %s WHERE id = ?" % RTREE_TABLE, (int(node_id),))
+    elif kind == 'grid':
+        conn.execute("DELETE FROM %s WHERE id = ?" % GRID_TABLE, (int(node_id),))
+
+
+# ================================ #
+#           Queries                #
+# ================================ #
+
+def bbox_query(conn, min_lat, min_lon, max_lat, max_lon, amenity=False,
+               amenity_value=None):
+    """ Returns the (id, lat, lon) of every node inside the bounding box,
+        using the spatial index if there is one. With 'amenity', only nodes
+        with an amenity tag are returned, as (id, lat, lon, amenity); with
+        'amenity_value' only that kind of amenity (for example 'cafe').
+    """
+    select = "SELECT n.id, n.lat, n.lon"
+    joins = ""
+    params = []
+    if amenity or amenity_value is not None:
+        select += ", t.value"
+        joins = " JOIN nodes_tags t ON t.id = n.id AND t.key = 'amenity'"
+        if amenity_value is not None:
+            joins += " AND t.value = ?"
+            params.append(amenity_value)
+    exact = " n.lat BETWEEN ? AND ? AND n.lon BETWEEN ? AND ?"
+    bounds = [min_lat, max_lat, min_lon, max_lon]
+
+    kind = spatial_index_kind(conn)
+    if kind == 'rtree':
+        # The R-tree stores 32-bit floats rounded outwards, so its matches are
+        # checked again against the exact coordinates
+        sql = (select + " FROM %s r CROSS JOIN nodes n ON n.id = r.id" % RTREE_TABLE +
+               joins + " WHERE r.max_lat >= ? AND r.min_lat <= ? AND "
+               "r.max_lon >= ? AND r.min_lon <= ? AND" + exact)
+        return conn.execute(sql, params + bounds + bounds).fetchall()
+    elif kind == 'grid':
+        sql = (select + " FROM %s g CROSS JOIN nodes n ON n.id = g.id" % GRID_TABLE +
+               joins + " WHERE g.cell BETWEEN ? AND ? AND" + exact)
+        rows = []
+        for row in range(grid_row(min_lat), grid_row(max_lat) + 1):
+            cells = [row * GRID_COLUMNS + grid_column(min_lon),
+                     row * GRID_COLUMNS + grid_column(max_lon)]
+            rows.extend(conn.execute(sql, params + cells + bounds))
+        return rows
+    return conn.execute(select + " FROM nodes n" + joins + " WHERE" + exact,
+                        params + bounds).fetchall()
+
+
+def nodes_in_bbox(conn, min_lat, min_lon, max_lat, max_lon):
+    """ Returns the (id, lat, lon) of every node inside the bounding box """
+    return bbox_query(conn, min_lat, min_lon, max_lat, max_lon)
+
+
+def amenities_in_bbox(conn, min_lat, min_lon, max_lat, max_lon, amenity=None):
+    """ Returns the (id, lat, lon, amenity) of every amenity node inside the
+        bounding box, optionally only of one kind of amenity
+    """
+    return bbox_query(conn, min_lat, min_lon, max_lat, max_lon, amenity=True,
+                      amenity_value=amenity)
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """ Great-circle (haversine) distance in metres """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bbox_around(lat, lon, radius):
+    """ Returns the (min_lat, min_lon, max_lat, max_lon) box that contains
+        the circle of 'radius' metres around a point
+    """
+    dlat = math.degrees(radius / EARTH_RADIUS)
+    dlon = math.degrees(radius / (EARTH_RADIUS * max(math.cos(math.radians(lat)), 1e-6)))
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+def nearest(conn, lat, lon, k=5, amenity=None):
+    """ Returns the k nodes nearest to a point as (distance in metres, id, lat,
+        lon) tuples, closest first. With 'amenity' (for example 'cafe'), only
+        that kind of amenity is searched, and the tuples end with its value.
+
+        The search starts in a small box around the point and widens it
+        until k nodes have been found within the search radius, so only the
+        neighbourhood of the point is ever read.
+    """
+    radius = INITIAL_RADIUS
+    while True:
+        rows = bbox_query(conn, *bbox_around(lat, lon, radius),
+                          amenity_value=amenity)
+        found = sorted((distance(lat, lon, row[1], row[2]),) + tuple(row)
+                       for row in rows)
+        within = [row for row in found if row[0] <= radius]
+        if len(within) >= k:
+            return within[:k]
+        if radius >= MAX_RADIUS:
+            return found[:k]
+        radius = min(radius * 4, MAX_RADIUS)
+
+
+# ================================ #
+#           Benchmark              #
+# ================================ #
+
+def benchmark(sqlite_file, box_size=0.01, repeat=20):
+    """ Times bounding-box and nearest-cafe queries around the middle of the
+        nodes in the database, with the spatial index and with a full scan of
+        the nodes table.
+    """
+    from benchmark import best_time
+
+    conn = sqlite3.connect(sqlite_file)
+    lat, lon = conn.execute("SELECT avg(lat), avg(lon) FROM nodes").fetchone()
+    bbox = (lat - box_size / 2, lon - box_size / 2,
+            lat + box_size / 2, lon + box_size / 2)
+
+    kind = spatial_index_kind(conn)
+    if kind is None:
+        kind = create_spatial_index(conn)
+        conn.commit()
+    indexed_time, indexed = best_time(lambda: nodes_in_bbox(conn, *bbox), repeat)
+    nearest_time, cafes = best_time(lambda: nearest(conn, lat, lon, 5, 'cafe'),
+                                    repeat)
+    scan_time, scanned = best_time(lambda: conn.execute(
+        "SELECT id, lat, lon FROM nodes WHERE lat BETWEEN ? AND ? AND "
+        "lon BETWEEN ? AND ?", (bbox[0], bbox[2], bbox[1], bbox[3])).fetchall(),
+        repeat)
+    conn.close()
+
+    results = {
+        'index': kind,
+        'nodes_in_bbox': len(indexed),
+        'same_nodes': sorted(indexed) == sorted(scanned),
+        'bbox_ms': 1000 * indexed_time,
+        'scan_ms': 1000 * scan_time,
+        'nearest_cafes_ms': 1000 * nearest_time,
+        'nearest_cafes': cafes
+    }
+    pprint.pprint(results)
+    return results
@@ -0,0 +1,111 @@
+import csv
+import os
+import pprint
+import time
+
+from preparing_for_database import NODES_PATH, NODES_TAG_PATH, WAYS_PATH, \
+    WAY_NODES_PATH, WAY_TAGS_PATH, RELATIONS_PATH, RELATION_MEMBERS_PATH, \
+    RELATION_TAGS_PATH
+from sql_schema import TABLES, column_converters, create_indexes, \
+    create_tables, create_tags_pivot, create_tags_view, insert_sql, \
+    table_columns
+from spatial_index import create_spatial_index
+from sqlite_loader import BATCH_SIZE, connect
+
+CSV_FILES = {
+    'nodes': NODES_PATH,
+    'nodes_tags': NODES_TAG_PATH,
+    'ways': WAYS_PATH,
+    'ways_nodes': WAY_NODES_PATH,
+    'ways_tags': WAY_TAGS_PATH,
+    'relations': RELATIONS_PATH,
+    'relation_members': RELATION_MEMBERS_PATH,
+    'relation_tags': RELATION_TAGS_PATH
+}
+""" The CSV file written by process_map for each table """
+
+
+def typed_rows(csv_file, table_name):
+    """ Reads a CSV file written by process_map and yields each row as a tuple
+        in the table's column order, decoded from UTF-8 and converted to the
+        column types.
+    """
+    csv_reader = csv.reader(csv_file)
+    header = next(csv_reader)
+    # Builds "lambda row: (convert_0(row[i]), convert_1(row[j]), ...)" so that
+    # each row is converted without looping over the columns in Python
+    namespace = {}
+    items = []
+    for n, (column, converter) in enumerate(zip(table_columns(table_name),
+                                                column_converters(table_name))):
+        namespace['convert_%d' % n] = converter
+        items.append('convert_%d(row[%d])' % (n, header.index(column)))
+    convert_row = eval('lambda row: (%s,)' % ', '.join(items), namespace)
+    for row in csv_reader:
+        yield convert_row(row)
+
+
+def import_table(conn, table_name, csv_path, batch_size=BATCH_SIZE):
+    """ Inserts every row of a CSV file into its table, one transaction per
+        batch. Returns the number of rows.
+    """
+    cur = conn.cursor()
+    statement = insert_sql(table_name)
+    count = 0
+    with open(csv_path, 'rb') as csv_file:
+        rows = []
+        for row in typed_rows(csv_file, table_name):
+            rows.append(row)
+            if len(rows) >= batch_size:
+                cur.execute("BEGIN")
+                cur.executemany(statement, rows)
+                cur.execute("COMMIT")
+                count += len(rows)
+                rows = []
+        cur.execute("BEGIN")
+        cur.executemany(statement, rows)
+        cur.execute("COMMIT")
+        count += len(rows)
+    return count
+
+
+def import_csvs(sqlite_file, csv_dir='.', table_names=None, pragmas=None,
+                batch_size=BATCH_SIZE, tags_pivot=False):
+    """ Imports the CSV files written by process_map into the SQLite database.
+        The given tables (all of them by default) are dropped and re-created with
+        typed columns, loaded, and only then indexed (the nodes table also
+        gets a spatial index, see spatial_index.py). The 'tags' view is created
+        and, with 'tags_pivot', the tags_pivot table is built.
+
+        Returns:
+            dictionary: rows per table and the seconds spent loading and
+            indexing.
+    """
+    if table_names is None:
+        table_names = [table_name for table_name, _ in TABLES]
+
+    start = time.time()
+    conn = connect(sqlite_file, pragmas)
+    create_tables(conn, table_names)
+
+    counts = {}
+    for table_name in table_names:
+        csv_path = os.path.join(csv_dir, CSV_FILES[table_name])
+        counts[table_name] = import_table(conn, table_name, csv_path, batch_size)
+    load_seconds = time.time() - start
+
+    create_indexes(conn, table_names)
+    if 'nodes' in table_names:
+        create_spatial_index(conn)
+    create_tags_view(conn)
+    if tags_pivot:
+        create_tags_pivot(conn)
+    conn.close()
+
+    report = {
+        'tables': counts,
+        'load_seconds': load_seconds,
+        'index_seconds': time.time() - start - load_seconds
+    }
+    pprint.pprint(report)
+    return report
@@ -0,0 +1,265 @@
+TABLES = [
+    ('nodes', [
+        ('id', 'INTEGER PRIMARY KEY NOT NULL'),
+        ('lat', 'REAL'),
+        ('lon', 'REAL'),
+        ('user', 'TEXT'),
+        ('uid', 'INTEGER'),
+        ('version', 'TEXT'),
+        ('changeset', 'INTEGER'),
+        ('timestamp', 'TEXT')
+    ]),
+    ('nodes_tags', [
+        ('id', 'INTEGER'),
+        ('key', 'TEXT'),
+        ('value', 'TEXT'),
+        ('type', 'TEXT')
+    ]),
+    ('ways', [
+        ('id', 'INTEGER PRIMARY KEY NOT NULL'),
+        ('user', 'TEXT'),
+        ('uid', 'INTEGER'),
+        ('version', 'TEXT'),
+        ('changeset', 'INTEGER'),
+        ('timestamp', 'TEXT')
+    ]),
+    ('ways_nodes', [
+        ('id', 'INTEGER NOT NULL'),
+        ('node_id', 'INTEGER NOT NULL'),
+        ('position', 'INTEGER NOT NULL')
+    ]),
+    ('ways_tags', [
+        ('id', 'INTEGER NOT NULL'),
+        ('key', 'TEXT'),
+        ('value', 'TEXT NOT NULL'),
+        ('type', 'TEXT')
+    ]),
+    ('relations', [
+        ('id', 'INTEGER PRIMARY KEY NOT NULL'),
+        ('user', 'TEXT'),
+        ('uid', 'INTEGER'),
+        ('version', 'TEXT'),
+        ('changeset', 'INTEGER'),
+        ('timestamp', 'TEXT')
+    ]),
+    ('relation_members', [
+        ('id', 'INTEGER NOT NULL'),
+        ('member_type', 'TEXT NOT NULL'),
+        ('member_id', 'INTEGER NOT NULL'),
+        ('role', 'TEXT'),
+        ('position', 'INTEGER NOT NULL')
+    ]),
+    ('relation_tags', [
+        ('id', 'INTEGER NOT NULL'),
+        ('key', 'TEXT'),
+        ('value', 'TEXT NOT NULL'),
+        ('type', 'TEXT')
+    ])
+]
+""" The SQLite tables, in load order, with their columns and column types.
+    The column names match the CSV headers written by process_map. The ids of
+    nodes, ways and relations are INTEGER PRIMARY KEYs, which SQLite stores as the rowid
+    itself rather than as a separate index, so they cost nothing extra while
+    loading (OSM files are sorted by id). Every other index is in INDEXES.
+    The key of a tag is NULL in every tags table when it has problem
+    characters, since shape_element leaves it out (the CSV files leave it
+    empty).
+"""
+
+INDEXES = [
+    ('nodes_tags_id', 'nodes_tags', ['id']),
+    ('nodes_tags_key_value', 'nodes_tags', ['key', 'value', 'id']),
+    ('nodes_tags_value', 'nodes_tags', ['value', 'id']),
+    ('ways_tags_id', 'ways_tags', ['id']),
+    ('ways_tags_key_value', 'ways_tags', ['key', 'value', 'id']),
+    ('ways_tags_value', 'ways_tags', ['value', 'id']),
+    ('ways_nodes_id', 'ways_nodes', ['id', 'position']),
+    ('ways_nodes_node_id', 'ways_nodes', ['node_id']),
+    ('relation_tags_id', 'relation_tags', ['id']),
+    ('relation_tags_key_value', 'relation_tags', ['key', 'value', 'id']),
+    ('relation_tags_value', 'relation_tags', ['value', 'id']),
+    ('relation_members_id', 'relation_members', ['id', 'position']),
+    ('relation_members_member', 'relation_members', ['member_type', 'member_id'])
+]
+""" Secondary indexes (name, table, columns). They are only created once the
+    tables have been loaded, since building an index in one go is much faster
+    than keeping it up to date row by row. The (key, value, id) and (value,
+    id) indexes cover the tag lookups in sql_queries.py, so those never read
+    the tables themselves. The two relation_members indexes find a relation's
+    members, and the relations an element is a member of, without a scan.
+"""
+
+TAG_TABLES = [
+    ('node', 'nodes_tags'),
+    ('way', 'ways_tags'),
+    ('relation', 'relation_tags')
+]
+""" The tags table of each element type, which the 'tags' view brings
+    together. Filters on the view are pushed down to each table, so they
+    still use the tag indexes.
+"""
+
+PIVOT_COLUMNS = [
+    ('name', 'name', 'regular'),
+    ('amenity', 'amenity', 'regular'),
+    ('cuisine', 'cuisine', 'regular'),
+    ('addr_housenumber', 'housenumber', 'addr'),
+    ('addr_street', 'street', 'addr'),
+    ('addr_postcode', 'postcode', 'addr'),
+    ('addr_city', 'city', 'addr')
+]
+""" Columns of the tags_pivot table: (column, tag key, tag type) """
+
+
+CONVERTERS = {
+    'INTEGER': lambda value: int(value) if value else None,
+    'REAL': lambda value: float(value) if value else None,
+    'TEXT': lambda value: value.decode('utf-8')
+}
+""" Converts UTF-8 CSV text to the Python type of each column type (empty
+    numbers become NULL)
+"""
+
+NULLABLE_TEXT_COLUMNS = frozenset(['key'])
+""" Text columns whose empty CSV field stands for a missing value, and is
+    loaded as NULL: the key of a tag with problem characters
+"""
+
+SHAPED_TABLES = {
+    'node': 'nodes',
+    'node_tags': 'nodes_tags',
+    'way': 'ways',
+    'way_nodes': 'ways_nodes',
+    'way_tags': 'ways_tags',
+    'relation': 'relations',
+    'relation_members': 'relation_members',
+    'relation_tags': 'relation_tags'
+}
+""" Maps each key of a shape_element dictionary to the table it goes in """
+
+
+def table_columns(table_name):
+    """ Returns the column names of a table """
+    return [column for column, _ in dict(TABLES)[table_name]]
+
+
+def column_converters(table_name):
+    """ Returns a function per column that converts a CSV string to the
+        column's type. NOT NULL numbers are converted directly, and empty
+        NULLABLE_TEXT_COLUMNS become NULL.
+    """
+    converters = []
+    for column, column_type in dict(TABLES)[table_name]:
+        base_type = column_type.split()[0]
+        if 'NOT NULL' in column_type and base_type == 'INTEGER':
+            converters.append(int)
+        elif column in NULLABLE_TEXT_COLUMNS and 'NOT NULL' not in column_type:
+            converters.append(lambda value: value.decode('utf-8') if value else None)
+        else:
+            converters.append(CONVERTERS[base_type])
+    return converters
+
+
+def create_table_sql(table_name):
+    """ Returns the CREATE TABLE statement for a table """
+    columns = ", ".join("%s %s" % column for column in dict(TABLES)[table_name])
+    return "CREATE TABLE %s (%s)" % (table_name, columns)
+
+
+def insert_sql(table_name, or_replace=False):
+    """ Returns the INSERT statement for a table, with one ? per column. With
+        'or_replace', a row with the same primary key is replaced.
+    """
+    columns = table_columns(table_name)
+    return "INSERT %sINTO %s (%s) VALUES (%s)" % (
+        "OR REPLACE " if or_replace else "", table_name, ", ".join(columns),
+        ", ".join("?" * len(columns)))
+
+
+def create_tables(conn, table_names=None):
+    """ Drops and re-creates the given tables (all of them by default),
+        without their secondary indexes. A tags_pivot built from the old tags
+        is dropped too.
+    """
+    cur = conn.cursor()
+    for table_name, _ in TABLES:
+        if table_names is None or table_name in table_names:
+            cur.execute("DROP TABLE IF EXISTS %s" % table_name)
+            cur.execute(create_table_sql(table_name))
+            if table_name in dict(TAG_TABLES).values():
+                cur.execute("DROP TABLE IF EXISTS tags_pivot")
+
+
+def create_indexes(conn, table_names=None):
+    """ Builds the secondary indexes of the given tables (all of them by
+        default). Meant to be run after the tables have been loaded.
+    """
+    cur = conn.cursor()
+    for index_name, table_name, columns in INDEXES:
+        if table_names is None or table_name in table_names:
+            cur.execute("CREATE INDEX IF NOT EXISTS %s ON %s (%s)"
+                        % (index_name, table_name, ", ".join(columns)))
+    cur.execute("ANALYZE")
+
+
+def create_tags_view(conn):
+    """ (Re)creates the 'tags' view over the tags tables that exist """
+    tables = set(name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'"))
+    selects = ["SELECT '%s' AS element, id, key, value, type FROM %s"
+               % (element, table_name) for element, table_name in TAG_TABLES
+               if table_name in tables]
+    conn.execute("DROP VIEW IF EXISTS tags")
+    if selects:
+        conn.execute("CREATE VIEW tags AS " + " UNION ALL ".join(selects))
+
+
+def tags_pivot_values_sql():
+    """ Returns the SQL for the PIVOT_COLUMNS values of a group of tag rows,
+        and the condition that picks the tag rows they come from
+    """
+    values = ", ".join("MAX(CASE WHEN key = '%s' AND type = '%s' THEN value END)"
+                       % (key, tag_type) for _, key, tag_type in PIVOT_COLUMNS)
+    keys = " OR ".join("(key = '%s' AND type = '%s')" % (key, tag_type)
+                       for _, key, tag_type in PIVOT_COLUMNS)
+    return values, keys
+
+
+def create_tags_pivot(conn):
+    """ (Re)builds 'tags_pivot', a table with one row per element that
+        has any of the common tags in PIVOT_COLUMNS, and one column per tag,
+        so that queries on them don't need a join (or subquery) per tag. It is
+        a snapshot: rebuild it after the tags change, or update the rows of
+        the elements that changed with update_tags_pivot.
+    """
+    create_tags_view(conn)
+    cur = conn.cursor()
+    cur.execute("DROP TABLE IF EXISTS tags_pivot")
+    cur.execute("CREATE TABLE tags_pivot (element TEXT NOT NULL, id INTEGER NOT NULL, "
+                "%s, PRIMARY KEY (element, id))"
+                % ", ".join("%s TEXT" % column for column, _, _ in PIVOT_COLUMNS))
+    values, keys = tags_pivot_values_sql()
+    cur.execute("INSERT INTO tags_pivot SELECT element, id, %s FROM tags "
+                "WHERE %s GROUP BY element, id" % (values, keys))
+    for column in ('amenity', 'cuisine', 'addr_postcode'):
+        cur.execute("CREATE INDEX tags_pivot_%s ON tags_pivot (%s)" % (column, column))
+    cur.execute("ANALYZE tags_pivot")
+
+
+def update_tags_pivot(conn, elements):
+    """ Rebuilds the tags_pivot rows of the given (element type, id) pairs
+        from their tags, reading each tags table by id, so the cost depends
+        on the number of elements rather than the size of the database
+    """
+    values, keys = tags_pivot_values_sql()
+    tag_tables = dict(TAG_TABLES)
+    ids = {}
+    for element, element_id in elements:
+        ids.setdefault(element, []).append((int(element_id),))
+    cur = conn.cursor()
+    for element, element_ids in ids.items():
+        cur.executemany("DELETE FROM tags_pivot WHERE element = '%s' AND id = ?"
+                        % element, element_ids)
+        cur.executemany("INSERT INTO tags_pivot SELECT '%s', id, %s FROM %s "
+                        "WHERE id = ? AND (%s) GROUP BY id"
+                        % (element, values, tag_tables[element], keys), element_ids)
@@ -0,0 +1,240 @@
+import os
+import pprint
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from osm_reader import get_element
+from preparing_for_database import shape_element, validate_element
+from schema_compiler import FastValidator
+from relation_members import RelationMembers
+from spatial_index import create_spatial_index
+from way_node_arrays import WayNodes
+from sql_schema import SHAPED_TABLES, TABLES, create_indexes, create_tables, \
+    create_tags_pivot, create_tags_view, insert_sql, table_columns
+
+PRAGMAS = {
+    'journal_mode': 'OFF',
+    'synchronous': 'OFF',
+    'cache_size': -200000
+}
+""" Default pragmas for a bulk load. With no journal and no syncing a crash
+    can leave a corrupt database, but the load can simply be re-run. A
+    negative cache size is in KiB, so the default is about 200 MB.
+"""
+
+BATCH_SIZE = 50000
+""" Number of rows inserted per transaction """
+
+
+NUMBER_TYPES = {'INTEGER': int, 'REAL': float}
+
+
+def number_converter(convert):
+    return lambda value: convert(value) if value is not None and value != '' else None
+
+
+def number_converters(table_name):
+    """ Returns, for each column of a table, a function that converts a
+        shaped value (attribute text) to the column's number type, or None
+        for text columns. Missing and empty values become NULL, as in
+        import_csvs, so both loaders store the same values.
+    """
+    return [number_converter(NUMBER_TYPES[column_type.split()[0]])
+            if column_type.split()[0] in NUMBER_TYPES else None
+            for _, column_type in dict(TABLES)[table_name]]
+
+
+def table_rows(value, columns, converters=None):
+    """ Returns the row tuples of one value of a shaped element (a dictionary,
+        a list of dictionaries, WayNodes or RelationMembers), in the order of
+        'columns'. With 'converters' (see number_converters), the values of
+        the number columns are converted.
+    """
+    if isinstance(value, (WayNodes, RelationMembers)):
+        return value.rows()             # Already in the table's column order
+    if isinstance(value, dict):
+        value = [value]
+    rows = [tuple(row.get(column) for column in columns) for row in value]
+    if converters is not None:
+        rows = [tuple([item if convert is None else convert(item)
+                       for convert, item in zip(converters, row)]) for row in rows]
+    return rows
+
+
+class SQLiteSink(object):
+    """ Buffers shaped elements as row tuples for each table, and inserts them
+        with one prepared INSERT per table and one transaction per batch.
+    """
+
+    def __init__(self, conn, batch_size=BATCH_SIZE):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.columns = dict((table_name, table_columns(table_name))
+                            for table_name, _ in TABLES)
+        self.converters = dict((table_name, number_converters(table_name))
+                               for table_name, _ in TABLES)
+        self.statements = dict((table_name, insert_sql(table_name))
+                               for table_name, _ in TABLES)
+        self.rows = dict((table_name, []) for table_name, _ in TABLES)
+        self.counts = dict((table_name, 0) for table_name, _ in TABLES)
+        self.buffered = 0
+
+    def add(self, el):
+        """ Adds the rows of one shaped element, flushing when the batch is full """
+        for key, value in el.iteritems():
+            table_name = SHAPED_TABLES[key]
+            rows = table_rows(value, self.columns[table_name],
+                              self.converters[table_name])
+            self.rows[table_name].extend(rows)
+            self.buffered += len(rows)
+        if self.buffered >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """ Inserts every buffered row in a single transaction """
+        cur = self.conn.cursor()
+        cur.execute("BEGIN")
+        for table_name, _ in TABLES:
+            rows = self.rows[table_name]
+            if rows:
+                cur.executemany(self.statements[table_name], rows)
+                self.counts[table_name] += len(rows)
+                self.rows[table_name] = []
+        cur.execute("COMMIT")
+        self.buffered = 0
+
+
+def connect(sqlite_file, pragmas=None):
+    """ Opens the database in autocommit mode (so transactions are controlled
+        explicitly) and applies the pragmas.
+    """
+    settings = dict(PRAGMAS)
+    settings.update(pragmas or {})
+    conn = sqlite3.connect(sqlite_file, isolation_level=None)
+    for name, value in settings.items():
+        conn.execute("PRAGMA %s = %s" % (name, value))
+    return conn
+
+
+def load_osm(file_in, sqlite_file, validate=False, batch_size=BATCH_SIZE,
+             pragmas=None, tags_pivot=False):
+    """ Streams the OSM file straight into the SQLite database, without the
+        intermediate CSV files. Every element is shaped with shape_element (so
+        street names and postal codes are cleaned the same way) and its rows
+        are inserted into the tables in batched transactions. The
+        secondary indexes, and the spatial index of the nodes (see
+        spatial_index.py), are built once everything has been inserted,
+        along with the 'tags' view and, with 'tags_pivot', the tags_pivot
+        table (see sql_schema.py).
+
+        Returns:
+            dictionary: rows per table, total rows, seconds and rows/second.
+    """
+    start = time.time()
+    conn = connect(sqlite_file, pragmas)
+    create_tables(conn)
+
+    sink = SQLiteSink(conn, batch_size)
+    validator = FastValidator()
+    for element in get_element(file_in):
+        el = shape_element(element, compact_way_nodes=True)
+        if el:
+            if validate is True:
+                validate_element(el, validator)
+            sink.add(el)
+    sink.flush()
+    create_indexes(conn)
+    create_spatial_index(conn)
+    create_tags_view(conn)
+    if tags_pivot:
+        create_tags_pivot(conn)
+    conn.close()
+
+    seconds = time.time() - start
+    rows = sum(sink.counts.values())
+    report = {
+        'tables': sink.counts,
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds else 0.0
+    }
+    pprint.pprint(report)
+    return report
+
+
+# ================================ #
+#           Test                   #
+# ================================ #
+
+PROBLEM_KEY_OSM = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+ <node id="1" lat="49.2757714" lon="-123.12" user="a" uid="1" version="1" changeset="1" timestamp="2016-01-01T00:00:00Z">
+  <tag k="bad key?" v="node value"/>
+  <tag k="name" v="Cafe"/>
+ </node>
+ <node id="2" lat="49.29" lon="-123.13" user="a" uid="1" version="1" changeset="1" timestamp="2016-01-01T00:00:00Z"/>
+ <way id="3" user="a" uid="1" version="1" changeset="1" timestamp="2016-01-01T00:00:00Z">
+  <nd ref="1"/>
+  <nd ref="2"/>
+  <tag k="bad key?" v="way value"/>
+ </way>
+ <relation id="4" user="a" uid="1" version="1" changeset="1" timestamp="2016-01-01T00:00:00Z">
+  <member type="way" ref="3" role="outer"/>
+  <tag k="bad key?" v="relation value"/>
+ </relation>
+</osm>
+"""
+""" A node, a way and a relation, each with a tag whose key has problem
+    characters
+"""
+
+
+def table_contents(sqlite_file):
+    """ Returns the rows of every table, by table name """
+    conn = sqlite3.connect(sqlite_file)
+    try:
+        return dict((table_name, sorted(conn.execute("SELECT * FROM %s" % table_name)))
+                    for table_name, _ in TABLES)
+    finally:
+        conn.close()
+
+
+def test():
+    """ Checks that tags whose keys have problem characters are loaded into
+        every tags table with a NULL key, both directly and from the CSV
+        files, where the key is empty, and that both loaders store the same
+        rows in every table
+    """
+    from preparing_for_database import process_map
+    from sql_importer import import_csvs
+
+    tmp_dir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        osm_file = os.path.join(tmp_dir, 'problem_key.osm')
+        with open(osm_file, 'w') as f:
+            f.write(PROBLEM_KEY_OSM)
+        direct_file = os.path.join(tmp_dir, 'direct.db')
+        load_osm(osm_file, direct_file)
+        csv_file = os.path.join(tmp_dir, 'csv.db')
+        os.chdir(tmp_dir)
+        process_map(osm_file, validate=False)
+        import_csvs(csv_file, csv_dir=tmp_dir)
+        for sqlite_file in (direct_file, csv_file):
+            conn = sqlite3.connect(sqlite_file)
+            for table_name, element_id in (('nodes_tags', 1), ('ways_tags', 3),
+                                           ('relation_tags', 4)):
+                rows = conn.execute("SELECT id, key, value FROM %s WHERE key IS NULL"
+                                    % table_name).fetchall()
+                element = table_name.split('_')[0].rstrip('s')
+                assert rows == [(element_id, None, element + ' value')], \
+                    (sqlite_file, table_name, rows)
+            assert conn.execute("SELECT key, value FROM nodes_tags WHERE key IS NOT NULL"
+                                ).fetchall() == [('name', 'Cafe')]
+            conn.close()
+        assert table_contents(direct_file) == table_contents(csv_file)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,135 @@
+import pprint
+import re
+
+
+class SuffixRewriter(object):
+    """ Rewrites the street type at the end of a street name (for example
+        'Beatty St' => 'Beatty Street') using a mapping of incorrect to correct
+        street types. It is built once from the mapping, and each rewrite is a
+        split of the name plus a dictionary lookup, so it runs in O(len(name))
+        and never compiles a pattern. Only the final token is ever replaced,
+        unlike re.sub, which also rewrote every earlier occurrence of the street
+        type and treated keys such as 'St.' as regexes.
+    """
+
+    def __init__(self, mapping):
+        self.mapping = dict(mapping)
+
+    def street_type(self, name):
+        """ Returns the last word of the name (the street type), or None if
+            the name is empty or ends in whitespace.
+        """
+        if not name or name[-1].isspace():
+            return None
+        return name.rsplit(None, 1)[-1]
+
+    def rewrite(self, name):
+        street_type = self.street_type(name)
+        better_type = self.mapping.get(street_type)
+        if better_type is None:
+            return name
+        return name[:len(name) - len(street_type)] + better_type
+
+
+_rewriters = {}
+
+
+def street_rewriter(mapping):
+    """ Returns the SuffixRewriter for a mapping, building it the first time
+        the mapping is used. Mappings are treated as constants.
+    """
+    cached = _rewriters.get(id(mapping))
+    if cached is None or cached[0] is not mapping:
+        cached = (mapping, SuffixRewriter(mapping))
+        _rewriters[id(mapping)] = cached
+    return cached[1]
+
+
+# ================================ #
+#           Test                   #
+# ================================ #
+
+TEST_MAPPING = {
+    'St': 'Street',
+    'St.': 'Street',
+    'Ave': 'Avenue',
+    'Dr.': 'Drive',
+    'Denmanstreet': 'Denman Street'
+}
+
+REWRITE_CASES = [
+    # (name, rewritten name, what the old re.sub approach returned)
+    ('Main St.', 'Main Street', 'Main Street'),
+    ('Beatty St', 'Beatty Street', 'Beatty Street'),
+    ('West 4th Ave', 'West 4th Avenue', 'West 4th Avenue'),
+    ('Commercial Dr.', 'Commercial Drive', 'Commercial Drive'),
+    ('Denmanstreet', 'Denman Street', 'Denman Street'),
+    ('St. George Street', 'St. George Street', 'St. George Street'),
+    ('Kingsway', 'Kingsway', 'Kingsway'),
+    ('Main Stx', 'Main Stx', 'Main Stx'),
+    ('Main St ', 'Main St ', 'Main St '),
+    ('', '', ''),
+    ('St Johns St', 'St Johns Street', 'Street Johns Street'),
+    ('Stanley St.', 'Stanley Street', 'Streetnley Street')
+]
+""" Street names with their expected rewrite under TEST_MAPPING. The last
+    two are where re.sub went wrong: it replaced every occurrence of the
+    street type, and matched 'St.' as a regex.
+"""
+
+
+def re_sub_rewrite(name, mapping):
+    """ The old rewrite, kept to compare against """
+    from auditing_street_names import street_type_re
+
+    m = street_type_re.search(name)
+    if m:
+        street_type = m.group()
+        if street_type in mapping.keys():
+            name = re.sub(street_type, mapping[street_type], name)
+    return name
+
+
+def test(osm_file, mapping=None, repeat=3):
+    """ Checks the rewriter, and the old re.sub approach, against the
+        expected rewrites in REWRITE_CASES. Then runs both over every
+        'addr:street' value in the file, reports the names where they differ,
+        and compares their speed.
+    """
+    from osm_reader import get_element
+    from benchmark import best_time
+
+    test_rewriter = SuffixRewriter(TEST_MAPPING)
+    for name, expected, expected_re_sub in REWRITE_CASES:
+        assert test_rewriter.rewrite(name) == expected, \
+            (name, test_rewriter.rewrite(name), expected)
+        assert re_sub_rewrite(name, TEST_MAPPING) == expected_re_sub, \
+            (name, re_sub_rewrite(name, TEST_MAPPING), expected_re_sub)
+
+    if mapping is None:
+        from cleaning_rules import load_rules
+        mapping = load_rules().cleaner_options('street_type')['mapping']
+
+    names = [tag.attrib['v']
+             for element in get_element(osm_file, tags=('node', 'way'))
+             for tag in element.iter('tag')
+             if tag.get('k') == 'addr:street']
+
+    rewriter = SuffixRewriter(mapping)
+
+    def re_sub(name):
+        return re_sub_rewrite(name, mapping)
+
+    re_sub_time, _ = best_time(lambda: map(re_sub, names), repeat)
+    rewriter_time, _ = best_time(lambda: map(rewriter.rewrite, names), repeat)
+    results = {
+        'names': len(names),
+        'changed': sum(1 for name in names if rewriter.rewrite(name) != name),
+        'differs_from_re_sub': sorted(set(
+            (name, re_sub(name), rewriter.rewrite(name)) for name in names
+            if re_sub(name) != rewriter.rewrite(name))),
+        're_sub_us_per_name': 1e6 * re_sub_time / max(len(names), 1),
+        'rewriter_us_per_name': 1e6 * rewriter_time / max(len(names), 1)
+    }
+    pprint.pprint(results)
+    return results
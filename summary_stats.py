@@ -0,0 +1,179 @@
+from heapq import heappop, heappush
+import json
+import pprint
+
+SKETCH_SIZE = 1000
+""" Number of items counted by each heavy-hitter sketch """
+
+TOP_K = 10
+
+
+class SpaceSaving(object):
+    """ Space-Saving heavy-hitter sketch (Metwally et al.). It counts at most
+        'capacity' distinct items: when a new item arrives and the sketch is
+        full, the item with the smallest count is replaced, and the new item
+        inherits that count (recorded as its error). Each reported count
+        over-estimates the true count by at most its error, which is at most
+        N / capacity after N additions, so every item seen more than that
+        many times is in the sketch. While there are no more distinct items
+        than 'capacity', the counts are exact.
+    """
+
+    def __init__(self, capacity=SKETCH_SIZE):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.heap = []      # (count, item) entries, some of them out of date
+
+    def add(self, item, count=1):
+        counts = self.counts
+        if item in counts:
+            counts[item] += count
+            return
+        error = 0
+        if len(counts) >= self.capacity:
+            # Pops the smallest entry that is still up to date; since counts
+            # only grow, it has the smallest count in the sketch
+            while True:
+                error, victim = heappop(self.heap)
+                current = counts.get(victim)
+                if current == error:
+                    break
+                if current is not None:
+                    heappush(self.heap, (current, victim))
+            del counts[victim]
+            del self.errors[victim]
+        counts[item] = error + count
+        self.errors[item] = error
+        heappush(self.heap, (error + count, item))
+
+    def top(self, k=TOP_K):
+        """ Returns the k items with the highest counts, as (item, count,
+            error) tuples
+        """
+        items = sorted(self.counts.iteritems(), key=lambda item: (-item[1], item[0]))
+        return [(item, count, self.errors[item]) for item, count in items[:k]]
+
+
+class SummaryStats(object):
+    """ The overview numbers of the README, kept up to date element by element
+        while process_map runs, instead of with table scans after the import:
+        node, way and relation counts, unique users (by uid), top
+        contributors, users with a single post, and top amenities and
+        cuisines. As in the README, the user numbers only cover nodes and ways.
+
+        Users are kept in two sets, those seen once and those seen more than
+        once, so single-post users are exact. Contributors, amenities and
+        cuisines are counted with Space-Saving sketches.
+    """
+
+    def __init__(self, sketch_size=SKETCH_SIZE):
+        self.counts = {'node': 0, 'way': 0, 'relation': 0, 'node_tags': 0,
+                       'way_tags': 0, 'way_nodes': 0, 'relation_tags': 0,
+                       'relation_members': 0}
+        self.uids = set()
+        self.users_once = set()
+        self.users_many = set()
+        self.contributors = SpaceSaving(sketch_size)
+        self.amenities = SpaceSaving(sketch_size)
+        self.cuisines = SpaceSaving(sketch_size)
+
+    def add(self, el):
+        """ Adds one element shaped by shape_element """
+        if 'node' in el:
+            attribs = el['node']
+            tags = el['node_tags']
+            self.counts['node'] += 1
+            self.counts['node_tags'] += len(tags)
+            restaurant = False
+            cuisines = []
+            for tag in tags:
+                key = tag.get('key')
+                if key == 'amenity':
+                    self.amenities.add(tag['value'])
+                elif key == 'cuisine':
+                    cuisines.append(tag['value'])
+                if tag['value'] == 'restaurant':
+                    restaurant = True
+            if restaurant:
+                for cuisine in cuisines:
+                    self.cuisines.add(cuisine)
+        elif 'way' in el:
+            attribs = el['way']
+            self.counts['way'] += 1
+            self.counts['way_tags'] += len(el['way_tags'])
+            self.counts['way_nodes'] += len(el['way_nodes'])
+        else:
+            # Relations aren't in the README's user statistics
+            self.counts['relation'] += 1
+            self.counts['relation_tags'] += len(el['relation_tags'])
+            self.counts['relation_members'] += len(el['relation_members'])
+            return
+
+        self.uids.add(attribs['uid'])
+        user = attribs['user']
+        if user in self.users_once:
+            self.users_once.remove(user)
+            self.users_many.add(user)
+        elif user not in self.users_many:
+            self.users_once.add(user)
+        self.contributors.add(user)
+
+    def result(self):
+        return {
+            'nodes': self.counts['node'],
+            'ways': self.counts['way'],
+            'nodes_tags': self.counts['node_tags'],
+            'ways_tags': self.counts['way_tags'],
+            'ways_nodes': self.counts['way_nodes'],
+            'relations': self.counts['relation'],
+            'relation_tags': self.counts['relation_tags'],
+            'relation_members': self.counts['relation_members'],
+            'unique_users': len(self.uids),
+            'single_post_users': len(self.users_once),
+            'top_users': self.contributors.top(),
+            'top_amenities': self.amenities.top(),
+            'top_cuisines': self.cuisines.top()
+        }
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.result(), f, indent=2, sort_keys=True)
+
+
+# ================================ #
+#           Test                   #
+# ================================ #
+
+def test(osm_file, sqlite_file=None):
+    """ Computes the summary of the file, and if a database built from it is
+        given, checks the counts against the README queries.
+    """
+    import sqlite3
+    from osm_reader import get_element
+    from preparing_for_database import shape_element
+
+    stats = SummaryStats()
+    for element in get_element(osm_file, tags=('node', 'way')):
+        stats.add(shape_element(element, compact_way_nodes=True))
+    result = stats.result()
+    pprint.pprint(result)
+
+    if sqlite_file is not None:
+        conn = sqlite3.connect(sqlite_file)
+        users = "(SELECT user, uid FROM nodes UNION ALL SELECT user, uid FROM ways)"
+        expected = {
+            'nodes': "SELECT COUNT(*) FROM nodes",
+            'ways': "SELECT COUNT(*) FROM ways",
+            'unique_users': "SELECT COUNT(DISTINCT(uid)) FROM %s" % users,
+            'single_post_users': "SELECT COUNT(*) FROM (SELECT user, COUNT(*) "
+                                 "as num FROM %s GROUP BY user HAVING num=1)" % users
+        }
+        for name, query in expected.items():
+            assert conn.execute(query).fetchone()[0] == result[name], name
+        top_users = conn.execute("SELECT user, COUNT(*) as num FROM %s GROUP BY "
+                                 "user ORDER BY num DESC, user LIMIT 10" % users)
+        assert [tuple(row) for row in top_users] == \
+            [(user, count) for user, count, _ in result['top_users']]
+        conn.close()
+    return result
@@ -1,12 +1,11 @@
-import xml.etree.ElementTree as ET
 from collections import defaultdict
-from auditing_postal_codes import audit
+from auditing_postal_codes import audit, POSTAL_CODE_PATTERN
 import re
 import pprint
 
 VANCOUVER_CITY_OSM = "/Users/nehaludyavar/Downloads/Vancouver_City_v2.osm"
 
-postal_code_re_alt = re.compile(r'[A-Z^DFIOQUWZ]\d[A-Z^DFIOQU]\s?\d[A-Z^DFIOQU]\d$', re.IGNORECASE)
+postal_code_re_alt = re.compile(POSTAL_CODE_PATTERN % r'\s?', re.IGNORECASE)
 """ Regex that is similar to the auditing_postal_codes regex, but this time the
     space between the groups of three is optional.
 """
@@ -21,7 +20,7 @@ number_PCs = []                             # Empty list for numerical postcodes
 
 def update_postal_code(osmfile):
     """ If a postcode is in the list returned by the audit function, it first
-        removes any whitespace and then makes the string uppercase. Then it uses
+        removes all whitespace and then makes the string uppercase. Then it uses
         the postal_code_re_alt regex to find a match, and if one is found, it
         groups the match object and returns the string grouped by 3. If there is
         no match, it appends the postcode to the problem_PCs list. Next, it
@@ -31,14 +30,11 @@ def update_postal_code(osmfile):
     """
     incorrect_PCs = audit(osmfile)
     for postcode in incorrect_PCs:
-        stripped_upper = postcode.strip().upper()
+        stripped_upper = "".join(postcode.split()).upper()
         m = postal_code_re_alt.match(stripped_upper)
         if m:
             PC = m.group()
-            char_list = list(PC)
-            post_code = char_list[0] + char_list[1] + char_list[2] + " " + \
-                    char_list[3] + char_list[4] + char_list[5]
-            return post_code
+            return PC[:3] + " " + PC[3:]
         else:
             problem_PCs.append(postcode)
 
@@ -55,24 +51,31 @@ def update_postal_code(osmfile):
 
 def shape_update_postal_code(postcode):
     """ Same as update_postal_code function, but takes the postcode instead of
-        the XML file as the argument (for the shape_element function).
+        the XML file as the argument (for the shape_element function). Postcodes
+        that can't be fixed are returned unchanged, and aren't collected into
+        problem_PCs, which only update_postal_code builds.
     """
-    stripped_upper = postcode.strip().upper()
+    stripped_upper = "".join(postcode.split()).upper()
     m = postal_code_re_alt.match(stripped_upper)
     if m:
         PC = m.group()
-        char_list = list(PC)
-        post_code = char_list[0] + char_list[1] + char_list[2] + " " + \
-                    char_list[3] + char_list[4] + char_list[5]
-        return post_code
-    else:
-        problem_PCs.append(postcode)
+        return PC[:3] + " " + PC[3:]
+    return postcode
 
-    for postcode in problem_PCs:
-        n = postal_code_number_re.search(postcode)
-        if n:
-            number_PC = n.group()
-            number_PCs.append(number_PC)
-            problem_PCs.remove(number_PC)
-        else:
-            pass
+
+POSTAL_CODE_CASES = [
+    ('V5V 3R8', 'V5V 3R8'),
+    ('v5v3r8', 'V5V 3R8'),
+    ('V5V3R8', 'V5V 3R8'),
+    (' v6t  1z4 ', 'V6T 1Z4'),
+    ('98225', '98225'),
+    ('BC V6B', 'BC V6B')
+]
+""" Postcodes with what shape_update_postal_code should turn them into """
+
+
+def test():
+    """ Checks shape_update_postal_code against POSTAL_CODE_CASES """
+    for postcode, expected in POSTAL_CODE_CASES:
+        assert shape_update_postal_code(postcode) == expected, \
+            (postcode, shape_update_postal_code(postcode), expected)
@@ -0,0 +1,215 @@
+from array import array
+from collections import defaultdict
+import hashlib
+import math
+import os
+import pprint
+import shutil
+import struct
+import tempfile
+
+from osm_reader import get_element
+from summary_stats import SpaceSaving, TOP_K
+
+
+def hash64(value):
+    """ Returns a well-mixed 64-bit hash of a user name """
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return struct.unpack('<Q', hashlib.md5(value).digest()[:8])[0]
+
+
+class ExactUserCounter(object):
+    """ Counts every user's contributions in a dictionary. Memory grows with
+        the number of distinct users, and the answers are exact.
+    """
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+
+    def add(self, user):
+        self.counts[user] += 1
+
+    def distinct(self):
+        return len(self.counts)
+
+    def top(self, k=TOP_K):
+        """ Returns the k biggest contributors as (user, count) tuples """
+        items = sorted(self.counts.iteritems(), key=lambda item: (-item[1], item[0]))
+        return items[:k]
+
+
+class HyperLogLog(object):
+    """ HyperLogLog distinct counter (Flajolet et al.) with 2^precision one-
+        byte registers. Its standard error is 1.04 / sqrt(2^precision), about
+        1.6% with the default 4 KB of registers, whatever the number of
+        distinct items. Small counts use linear counting, which is nearly
+        exact.
+    """
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+
+    def add_hash(self, h):
+        bits = 64 - self.precision
+        index = h >> bits
+        # Position of the first 1 bit in the remaining bits
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def add(self, value):
+        self.add_hash(hash64(value))
+
+    def count(self):
+        m = float(self.m)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(b'\x00')
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class CountMinSketch(object):
+    """ Count-Min sketch (Cormode and Muthukrishnan): 'depth' rows of 'width'
+        counters. An estimate is never below the true count, and with
+        width = e / epsilon and depth = ln(1 / delta) it is above it by more
+        than epsilon * N (N being the number of additions) with probability
+        at most delta. The defaults give epsilon = 0.001 and delta = 0.7%, in
+        about 110 KB.
+    """
+
+    def __init__(self, width=2719, depth=5):
+        self.width = width
+        self.depth = depth
+        self.rows = [array('l', [0]) * width for _ in range(depth)]
+
+    def _columns(self, h):
+        # Double hashing: the i-th row uses h1 + i * h2
+        h1, h2 = h & 0xFFFFFFFF, h >> 32
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add_hash(self, h, count=1):
+        for row, column in zip(self.rows, self._columns(h)):
+            row[column] += count
+
+    def estimate_hash(self, h):
+        return min(row[column] for row, column in zip(self.rows, self._columns(h)))
+
+    def estimate(self, value):
+        return self.estimate_hash(hash64(value))
+
+
+class ApproximateUserCounter(object):
+    """ Counts users in bounded memory, whatever the number of contributors:
+        a HyperLogLog for the number of distinct users, a Space-Saving sketch
+        for the candidate top contributors, and a Count-Min sketch for their
+        contribution counts. Both sketches only over-estimate, so each
+        reported count is the smaller of the two estimates.
+    """
+
+    def __init__(self, precision=12, width=2719, depth=5, capacity=1000):
+        self.distinct_users = HyperLogLog(precision)
+        self.contributions = CountMinSketch(width, depth)
+        self.candidates = SpaceSaving(capacity)
+
+    def add(self, user):
+        h = hash64(user)
+        self.distinct_users.add_hash(h)
+        self.contributions.add_hash(h)
+        self.candidates.add(user)
+
+    def distinct(self):
+        return self.distinct_users.count()
+
+    def top(self, k=TOP_K):
+        """ Returns the estimated k biggest contributors as (user, count) """
+        estimates = [(user, min(count, self.contributions.estimate(user)))
+                     for user, count, _ in self.candidates.top(len(self.candidates.counts))]
+        estimates.sort(key=lambda item: (-item[1], item[0]))
+        return estimates[:k]
+
+
+def analyze_users(osm_file, approximate=False, tags=('node', 'way', 'relation')):
+    """ Counts the distinct users and top contributors of the file's elements,
+        exactly or (with 'approximate') in bounded memory. Elements without a
+        user (anonymous or redacted) aren't counted as anyone's, only in
+        'anonymous_elements'.
+
+        Returns:
+            dictionary: elements, anonymous_elements, distinct_users and
+            top_users.
+    """
+    counter = ApproximateUserCounter() if approximate else ExactUserCounter()
+    elements = 0
+    anonymous = 0
+    for element in get_element(osm_file, tags=tags):
+        user = element.get('user')
+        if user is None:
+            anonymous += 1
+        else:
+            counter.add(user)
+        elements += 1
+    return {
+        'elements': elements,
+        'anonymous_elements': anonymous,
+        'distinct_users': counter.distinct(),
+        'top_users': counter.top()
+    }
+
+
+# ================================ #
+#           Test                   #
+# ================================ #
+
+ANONYMOUS_OSM = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+ <node id="1" lat="49.28" lon="-123.12" user="a" uid="1"/>
+ <node id="2" lat="49.28" lon="-123.12"/>
+ <node id="3" lat="49.28" lon="-123.12" user="b" uid="2"/>
+ <way id="4" user="a" uid="1"/>
+ <way id="5"/>
+</osm>
+"""
+""" Elements with and without a user """
+
+
+def test_anonymous():
+    """ Checks that both counters skip elements without a user, and agree """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        osm_file = os.path.join(tmp_dir, 'anonymous.osm')
+        with open(osm_file, 'w') as f:
+            f.write(ANONYMOUS_OSM)
+        exact = analyze_users(osm_file)
+        approximate = analyze_users(osm_file, approximate=True)
+    finally:
+        shutil.rmtree(tmp_dir)
+    expected = {'elements': 5, 'anonymous_elements': 2, 'distinct_users': 2,
+                'top_users': [('a', 2), ('b', 1)]}
+    assert exact == expected, exact
+    assert approximate == expected, approximate
+
+
+def test(osm_file):
+    """ Compares the approximate counts with the exact ones """
+    test_anonymous()
+    exact = analyze_users(osm_file)
+    approximate = analyze_users(osm_file, approximate=True)
+    exact_counts = dict(exact['top_users'])
+    results = {
+        'exact': exact,
+        'approximate': approximate,
+        'distinct_error': abs(approximate['distinct_users'] - exact['distinct_users']) /
+                          float(max(exact['distinct_users'], 1)),
+        'same_top_users': [user for user, _ in approximate['top_users']] ==
+                          [user for user, _ in exact['top_users']],
+        'max_count_error': max([count - exact_counts[user]
+                                for user, count in approximate['top_users']
+                                if user in exact_counts] or [0])
+    }
+    pprint.pprint(results)
+    return results
@@ -0,0 +1,177 @@
+from array import array
+import csv
+import os
+import pprint
+import sqlite3
+
+from auditing_street_names import street_type_re, expected
+from auditing_postal_codes import postal_code_re
+from preparing_for_database import NODES_TAG_PATH, WAY_TAGS_PATH
+
+AUDITED_TAGS = {
+    'street_types': ('street', 'addr'),
+    'postal_codes': ('postcode', 'addr')
+}
+""" The (key, type) of the tags each audit reads, as stored by process_map """
+
+
+def load_values(source, key, tag_type):
+    """ Returns the values of every node and way tag with the given key and
+        type, in the order process_map wrote them. 'source' is either a
+        SQLite database or a directory of CSV files written by process_map.
+    """
+    if os.path.isdir(source):
+        values = []
+        for path in (NODES_TAG_PATH, WAY_TAGS_PATH):
+            with open(os.path.join(source, path), 'rb') as csv_file:
+                reader = csv.reader(csv_file)
+                header = next(reader)
+                k, v, t = header.index('key'), header.index('value'), header.index('type')
+                values.extend(row[v].decode('utf-8') for row in reader
+                              if row[k] == key and row[t] == tag_type)
+        return values
+    conn = sqlite3.connect(source)
+    try:
+        return [value for (value,) in conn.execute(
+            "SELECT value FROM nodes_tags WHERE key = ? AND type = ? UNION ALL "
+            "SELECT value FROM ways_tags WHERE key = ? AND type = ?",
+            (key, tag_type, key, tag_type))]
+    finally:
+        conn.close()
+
+
+def factorize(values):
+    """ Splits a column of values into its distinct values (in order of first
+        appearance) and the index of each row's value among them, so that
+        uniques[codes[i]] == values[i].
+    """
+    index = {}
+    codes = array('l', [index.setdefault(value, len(index)) for value in values])
+    uniques = [None] * len(index)
+    for value, code in index.iteritems():
+        uniques[code] = value
+    return uniques, codes
+
+
+def broadcast(results, codes):
+    """ Expands one result per distinct value back to one result per row """
+    return [results[code] for code in codes]
+
+
+def street_types(uniques, clean=None):
+    """ Returns, for each distinct street name, its (street name, unexpected
+        street type) after 'clean', with None for the type when it is one of
+        the expected ones
+    """
+    results = []
+    for name in uniques:
+        if clean is not None:
+            name = clean(name)
+        m = street_type_re.search(name)
+        street_type = m.group() if m and m.group() not in expected else None
+        results.append((name, street_type))
+    return results
+
+
+def audit_street_types(values, clean=None):
+    """ Vectorized 'auditing_street_names.audit' over a column of street
+        names: the street type of each distinct name is checked once.
+
+        'clean' (for example a street name rewrite with a changed mapping)
+        is applied to each distinct name before it is checked, so a new
+        mapping can be re-audited without re-parsing the XML.
+
+        Returns:
+            dictionary: unexpected street type:street name pairs (the last
+            name with that type, like the XML audit), and the unexpected
+            street type of each row (None where it is expected).
+    """
+    uniques, codes = factorize(values)
+    results = street_types(uniques, clean)
+    last_row = dict(zip(codes, xrange(len(codes))))
+    report = {}
+    for code in sorted(last_row, key=last_row.get):
+        name, street_type = results[code]
+        if street_type is not None:
+            report[street_type] = name
+    return report, broadcast([street_type for _, street_type in results], codes)
+
+
+def audit_postal_codes(values, clean=None):
+    """ Vectorized 'auditing_postal_codes.audit' over a column of postcodes:
+        each distinct postcode is cleaned (if 'clean' is given) and matched
+        against the Canadian format once.
+
+        Returns:
+            the list of incorrect postcodes, one per row (like the XML
+            audit), and whether each row's postcode is correct.
+    """
+    uniques, codes = factorize(values)
+    if clean is not None:
+        uniques = [clean(postal_code) for postal_code in uniques]
+    correct = [postal_code_re.match(postal_code) is not None for postal_code in uniques]
+    row_correct = broadcast(correct, codes)
+    incorrect = [uniques[code] for code, ok in zip(codes, row_correct) if not ok]
+    return incorrect, row_correct
+
+
+def audit(source, street_clean=None, postal_code_clean=None):
+    """ Runs the street type and postal code audits over the tags already
+        loaded in a SQLite database or CSV directory (see load_values).
+        Those values were already cleaned by shape_element, so this audits
+        the cleaned values, which show what the cleaning rules missed, while
+        the XML audits see the raw ones.
+
+        Returns:
+            dictionary: 'street_types' and 'postal_codes' reports, in the
+            same form as the XML audits' (but over the cleaned values).
+    """
+    key, tag_type = AUDITED_TAGS['street_types']
+    street_report, _ = audit_street_types(load_values(source, key, tag_type),
+                                          street_clean)
+    key, tag_type = AUDITED_TAGS['postal_codes']
+    incorrect, _ = audit_postal_codes(load_values(source, key, tag_type),
+                                      postal_code_clean)
+    return {'street_types': street_report, 'postal_codes': incorrect}
+
+
+# ================================ #
+#           Benchmark              #
+# ================================ #
+
+def benchmark(source, repeat=3):
+    """ Times the vectorized audits against running the XML audits' checks
+        row by row over the same values, and checks the results agree.
+    """
+    from collections import defaultdict
+    from auditing_street_names import audit_street_type
+    from auditing_postal_codes import audit_postal_code
+    from benchmark import best_time
+
+    columns = dict((name, load_values(source, key, tag_type))
+                   for name, (key, tag_type) in AUDITED_TAGS.items())
+
+    def row_by_row():
+        street_report = defaultdict(set)
+        for name in columns['street_types']:
+            audit_street_type(street_report, name)
+        correct, incorrect = [], []
+        for postal_code in columns['postal_codes']:
+            audit_postal_code(correct, incorrect, postal_code)
+        return dict(street_report), incorrect
+
+    def vectorized():
+        return (audit_street_types(columns['street_types'])[0],
+                audit_postal_codes(columns['postal_codes'])[0])
+
+    row_seconds, expected_result = best_time(row_by_row, repeat)
+    vectorized_seconds, result = best_time(vectorized, repeat)
+    results = {
+        'rows': dict((name, len(values)) for name, values in columns.items()),
+        'distinct': dict((name, len(set(values))) for name, values in columns.items()),
+        'row_by_row_ms': 1000 * row_seconds,
+        'vectorized_ms': 1000 * vectorized_seconds,
+        'same_result': result == expected_result
+    }
+    pprint.pprint(results)
+    return results
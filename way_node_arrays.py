@@ -0,0 +1,87 @@
+from array import array
+from itertools import repeat
+import pprint
+import sys
+import time
+
+TYPECODE = 'l'
+""" Array type of node ids and positions. A C long is 64 bits on Linux and
+    macOS, which OSM node ids need (they are past 2^32 already).
+"""
+
+FIELDS = ('id', 'node_id', 'position')
+""" The order of the values in each row, the same as WAY_NODES_FIELDS """
+
+
+class WayNodes(object):
+    """ Compact form of a way's 'way_nodes' list. Instead of one dictionary
+        (and three strings) per <nd> reference, it keeps the way id and two
+        integer arrays of node ids and positions, so a way costs about 16
+        bytes per node.
+
+        Iterating over it gives the same dictionaries shape_element builds
+        otherwise (with integer values), for code that expects them. The CSV
+        and SQL sinks use rows() instead.
+    """
+
+    __slots__ = ('way_id', 'node_ids', 'positions')
+
+    def __init__(self, way_id, node_ids=None, positions=None):
+        self.way_id = int(way_id)
+        self.node_ids = array(TYPECODE, node_ids or [])
+        self.positions = array(TYPECODE, positions or [])
+
+    def append(self, node_id, position):
+        self.node_ids.append(int(node_id))
+        self.positions.append(position)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def __iter__(self):
+        for node_id, position in zip(self.node_ids, self.positions):
+            yield {'id': self.way_id, 'node_id': node_id, 'position': position}
+
+    def rows(self):
+        """ Returns the (id, node_id, position) tuple of each node """
+        return zip(repeat(self.way_id, len(self.node_ids)),
+                   self.node_ids, self.positions)
+
+
+# ================================ #
+#           Benchmark              #
+# ================================ #
+
+def benchmark(osm_file):
+    """ Times shaping every way in the file with and without compact way
+        nodes, and compares the memory used by the way nodes.
+    """
+    from osm_reader import get_element
+    from preparing_for_database import shape_element
+
+    def dict_size(rows):
+        return sum(sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values())
+                   for row in rows) + sys.getsizeof(rows)
+
+    def array_size(way_nodes):
+        return (sys.getsizeof(way_nodes) + sys.getsizeof(way_nodes.node_ids) +
+                sys.getsizeof(way_nodes.positions))
+
+    results = {}
+    for compact, size in ((False, dict_size), (True, array_size)):
+        start = time.time()
+        for element in get_element(osm_file, tags=('way',)):
+            shape_element(element, compact_way_nodes=compact)
+        seconds = time.time() - start
+        total = 0
+        nodes = 0
+        for element in get_element(osm_file, tags=('way',)):
+            way_nodes = shape_element(element, compact_way_nodes=compact)['way_nodes']
+            total += size(way_nodes)
+            nodes += len(way_nodes)
+        results['compact' if compact else 'dicts'] = {
+            'seconds': seconds,
+            'bytes_per_node': float(total) / nodes if nodes else 0.0
+        }
+    pprint.pprint(results)
+    return results